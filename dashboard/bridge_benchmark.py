@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Meshtastic to MQTT bridge hot path
+Suites:
+  serialization  generic safe_json_convert + json.dumps vs the bridge's JSON encoder, and CBOR
+  receive        on_receive + process_packet + publish throughput per packet type
+  convert        safe_json_convert on nested User-like objects
+  node_info      publish_node_info and nodes_summary cost at 100 / 1k / 10k nodes
+  memory         bridge memory over a simulated 72-hour event
+
+Results can be written as JSON (--json) and compared against a previous
+run (--baseline), failing with exit code 1 when a metric regresses by more
+than --threshold.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+import mqtt_bridge
+from mqtt_bridge import safe_json_convert, PACKET_ENCODER, NODE_ENCODER, PACKET_CBOR_ENCODER, MeshtasticBridge
+from mesh_simulator import SimulatedMesh, SimulationConfig
+
+SUITES = ('serialization', 'receive', 'convert', 'node_info', 'memory')
+PACKET_TYPES = ('TEXT_MESSAGE_APP', 'NODEINFO_APP', 'POSITION_APP', 'TELEMETRY_APP')
+
+
+class FakeUser:
+    """Stand-in for the protobuf-backed User object seen in NODEINFO packets"""
+
+    def __init__(self):
+        self.id = "!435905b8"
+        self.shortName = "05b8"
+        self.longName = "Meshtastic 05b8"
+        self.hwModel = "HELTEC_V3"
+        self.macaddr = "ZGVmY29u"
+        self.isLicensed = False
+
+
+class FakeNested:
+    """Object with attributes holding further objects, lists and dicts"""
+
+    def __init__(self, depth):
+        self.user = FakeUser()
+        self.metrics = {'batteryLevel': 87, 'voltage': 4.07, 'history': [1, 2, 3, 4]}
+        self.neighbors = [FakeUser() for _ in range(3)]
+        self.child = FakeNested(depth - 1) if depth > 1 else None
+
+
+class FakeMessageInfo:
+    __slots__ = ('mid', 'rc')
+
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+
+
+class FakeMQTTClient:
+    """In-process stand-in for paho's Client: publish() only counts"""
+
+    def __init__(self):
+        self.mid = 0
+        self.published = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.mid += 1
+        self.published += 1
+        return FakeMessageInfo(self.mid)
+
+
+def connect_broker(address):
+    """A real paho client on host[:port], for running the receive suite through a local broker"""
+    host, _, port = address.partition(':')
+    client = mqtt.Client(client_id="bridge_benchmark", callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    client.max_queued_messages_set(0)
+    client.connect(host, int(port or 1883), 60)
+    client.loop_start()
+    return client
+
+
+def sample_packets():
+    """Representative packet_data dicts as built by MeshtasticBridge.decode_packet"""
+    base = {
+        'timestamp': '2025-08-09T14:03:11.123456',
+        'message_count': 4242,
+        'from_id': '!435905b8',
+        'to_id': '!ffffffff',
+        'from_name': '05b8',
+        'to_name': 'Node-FFFF',
+        'hop_limit': 3,
+        'hop_start': 7,
+        'want_ack': False,
+        'via_mqtt': False,
+        'channel': 0,
+        'rssi': -87,
+        'snr': 6.25,
+        'rx_time': 1754748191,
+    }
+    text = dict(base, port_num='TEXT_MESSAGE_APP', message_type='text', text='Anyone at the HRV booth? 📡')
+    telemetry = dict(base, port_num='TELEMETRY_APP', message_type='telemetry',
+                     battery_level=87, voltage=4.07, channel_utilization=12.5, air_util_tx=1.25)
+    position = dict(base, port_num='POSITION_APP', message_type='position',
+                    latitude=36.1147, longitude=-115.1728, altitude=610)
+    nodeinfo = dict(base, port_num='NODEINFO_APP', message_type='nodeinfo',
+                    user_info=safe_json_convert(FakeUser()))
+    # Unconverted User object: exercises the safe_json_convert fallback
+    nodeinfo_raw = dict(nodeinfo, user_info=FakeUser())
+    return {'text': text, 'telemetry': telemetry, 'position': position,
+            'nodeinfo': nodeinfo, 'nodeinfo-raw': nodeinfo_raw}
+
+
+def sample_node():
+    return {
+        'node_id': '!435905b8', 'short_name': '05b8', 'long_name': 'Meshtastic 05b8',
+        'hw_model': 'HELTEC_V3', 'last_heard': 1754748191, 'snr': 6.25, 'battery_level': 87,
+        'voltage': 4.07, 'channel_utilization': 12.5, 'air_util_tx': 1.25,
+    }
+
+
+def generic_encode(data):
+    return json.dumps(safe_json_convert(data), ensure_ascii=False)
+
+
+def bench(func, data, iterations):
+    """Best-of-5 cost of one call in microseconds"""
+    timer = timeit.Timer(lambda: func(data))
+    return min(timer.repeat(repeat=5, number=iterations)) / iterations * 1e6
+
+
+def result(value, unit, better='lower'):
+    return {'value': round(value, 3), 'unit': unit, 'better': better}
+
+
+class SimulatedClock:
+    """time.time() stand-in that only moves when advanced"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def make_bridge(client=None):
+    """A bridge wired to a fake (or given) MQTT client, with timers and publishing inline"""
+    bridge = MeshtasticBridge()
+    bridge.mqtt_client = client or FakeMQTTClient()
+    bridge.start_time = time.time()
+    # No background timers: flushes are measured explicitly
+    bridge.node_summary.start_timer = bridge.recent.start_timer = lambda delay, callback: None
+    # No rate limits either, so drain_publisher sends everything that was queued
+    bridge.publisher.rate_limits = []
+    return bridge
+
+
+def drain_publisher(bridge):
+    """Send everything the bridge has queued for MQTT, as the dispatcher would"""
+    publisher = bridge.publisher
+    with publisher.cond:
+        ready, _ = publisher._take_ready(time.monotonic())
+    for topic, payload, retain, trace in ready:
+        publisher._send(topic, payload, retain, trace)
+
+
+def packets_of_type(portnum, count, seed=1):
+    """count distinct synthetic packets of one portnum"""
+    mesh = SimulatedMesh(SimulationConfig(nodes=200, seed=seed))
+    packets = []
+    while len(packets) < count:
+        packet = mesh.make_packet()
+        if packet['decoded']['portnum'] == portnum:
+            packets.append(packet)
+    return packets
+
+
+def suite_serialization(args):
+    results = {}
+    cases = dict(sample_packets(), node=sample_node())
+    print(f"{'case':<14}{'generic us':>12}{'fast us':>10}{'speedup':>10}{'cbor us':>10}{'json B':>8}{'cbor B':>8}")
+    for name, data in cases.items():
+        encoder = NODE_ENCODER if name == 'node' else PACKET_ENCODER
+        assert encoder.encode(data) == generic_encode(data), f"{name}: encoders disagree"
+        generic = bench(generic_encode, data, args.iterations)
+        fast = bench(encoder.encode, data, args.iterations)
+        json_size = len(encoder.encode(data).encode('utf-8'))
+        line = f"{name:<14}{generic:>12.2f}{fast:>10.2f}{generic / fast:>9.1f}x"
+        results[f"{name}.generic_us"] = result(generic, 'us')
+        results[f"{name}.fast_us"] = result(fast, 'us')
+        if name != 'node':
+            cbor = bench(PACKET_CBOR_ENCODER.encode, data, args.iterations)
+            cbor_size = len(PACKET_CBOR_ENCODER.encode(data))
+            line += f"{cbor:>10.2f}{json_size:>8}{cbor_size:>8}"
+            results[f"{name}.cbor_us"] = result(cbor, 'us')
+            results[f"{name}.cbor_bytes"] = result(cbor_size, 'bytes')
+        print(line)
+    return results
+
+
+def suite_receive(args):
+    """Reader callback plus decode/encode/publish for each packet type, single-threaded"""
+    results = {}
+    client = connect_broker(args.broker) if args.broker else None
+    count = args.packets
+    print(f"{'packet type':<20}{'us/packet':>12}{'packets/s':>12}")
+    for portnum in PACKET_TYPES:
+        bridge = make_bridge(client)
+        radio = bridge.radios[0]
+        packets = packets_of_type(portnum, count)
+        started = time.perf_counter()
+        for packet in packets:
+            bridge.on_receive(packet, radio)
+            item = bridge.ingest.get_nowait()
+            if item is not None:
+                bridge.process_packet(*item)
+            drain_publisher(bridge)
+        elapsed = time.perf_counter() - started
+        per_packet = elapsed / count * 1e6
+        print(f"{portnum:<20}{per_packet:>12.2f}{count / elapsed:>12.0f}")
+        results[f"{portnum}.us_per_packet"] = result(per_packet, 'us')
+        results[f"{portnum}.packets_per_s"] = result(count / elapsed, 'packets/s', 'higher')
+    if client:
+        client.loop_stop()
+        client.disconnect()
+    return results
+
+
+def suite_convert(args):
+    results = {}
+    print(f"{'object':<14}{'us/call':>10}")
+    cases = {'user': FakeUser(), 'nested-1': FakeNested(1), 'nested-3': FakeNested(3)}
+    for name, obj in cases.items():
+        cost = bench(safe_json_convert, obj, max(args.iterations // 10, 100))
+        print(f"{name:<14}{cost:>10.2f}")
+        results[f"{name}.us"] = result(cost, 'us')
+    return results
+
+
+def suite_node_info(args):
+    """publish_node_info per call, and the nodes_summary flush it eventually triggers"""
+    results = {}
+    print(f"{'nodes':>7}{'publish us':>12}{'summary ms':>12}")
+    for size in (100, 1000, 10000):
+        bridge = make_bridge()
+        mesh = SimulatedMesh(SimulationConfig(nodes=size, seed=size))
+        records = []
+        for node in mesh.nodes:
+            record = bridge.nodes.get_or_create(node.num)
+            bridge.nodes.set_short_name(record, node.short_name)
+            record.long_name = node.long_name
+            record.hw_model = node.hw_model
+            records.append(record)
+        for record in records:
+            bridge.publish_node_info(record)  # Fill the summary fragments
+        bridge.publisher.clear()
+        calls = max(args.iterations // 10, 1000)
+        started = time.perf_counter()
+        for index in range(calls):
+            bridge.publish_node_info(records[index % size])
+        publish_us = (time.perf_counter() - started) / calls * 1e6
+        flushes = 20
+        started = time.perf_counter()
+        for _ in range(flushes):
+            bridge.node_summary.flush()
+        summary_ms = (time.perf_counter() - started) / flushes * 1e3
+        print(f"{size:>7}{publish_us:>12.2f}{summary_ms:>12.3f}")
+        results[f"{size}.publish_us"] = result(publish_us, 'us')
+        results[f"{size}.summary_ms"] = result(summary_ms, 'ms')
+    return results
+
+
+def suite_memory(args):
+    """Feed a simulated event through the bridge and sample traced memory every few hours
+
+    Nodes join over the first two days, traffic runs at --event-rate
+    packets per simulated hour, and the dedupe window is bypassed by
+    unique packet ids. The rolling stats run on a simulated clock, so they
+    hold the same buckets as after that many real hours. Growth should
+    flatten once every node is known.
+    """
+    results = {}
+    bridge = make_bridge()
+    clock = SimulatedClock()
+    bridge.rolling_stats = mqtt_bridge.RollingStats(clock=clock)
+    radio = bridge.radios[0]
+    mesh = SimulatedMesh(SimulationConfig(nodes=args.event_nodes, seed=72))
+    everyone = list(mesh.nodes)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    print(f"{'hour':>5}{'nodes':>7}{'traced KiB':>12}{'node table KiB':>16}")
+    for hour in range(1, args.hours + 1):
+        mesh.nodes = everyone[:max(1, len(everyone) * min(hour, 48) // 48)]
+        for _ in range(args.event_rate):
+            clock.advance(3600 / args.event_rate)
+            bridge.on_receive(mesh.make_packet(), radio)
+            item = bridge.ingest.get_nowait()
+            if item is not None:
+                bridge.process_packet(*item)
+        bridge.publish_stats()  # Prunes nodes and batteries not heard within the longest window
+        bridge.publisher.clear()
+        bridge.dedupe.expire(time.time() + mqtt_bridge.DEDUPE_WINDOW + 1)
+        if hour % 6 == 0 or hour == args.hours:
+            traced = tracemalloc.get_traced_memory()[0] - baseline
+            table = bridge.nodes.memory_report()
+            print(f"{hour:>5}{table['nodes']:>7}{traced / 1024:>12.0f}{table['total_bytes'] / 1024:>16.0f}")
+            if hour == 24:
+                day_one = traced
+    tracemalloc.stop()
+    results['traced_kib'] = result(traced / 1024, 'KiB')
+    results['node_table_kib'] = result(table['total_bytes'] / 1024, 'KiB')
+    results['bytes_per_node'] = result(table['bytes_per_node'], 'bytes')
+    if args.hours >= 48:
+        results['growth_after_day_one_kib'] = result((traced - day_one) / 1024, 'KiB')
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print metrics that moved and return the list of regressions beyond threshold"""
+    regressions = []
+    print(f"\n{'metric':<44}{'baseline':>12}{'current':>12}{'change':>9}")
+    for suite, metrics in results.items():
+        for name, current in metrics.items():
+            previous = baseline.get('results', {}).get(suite, {}).get(name)
+            if not previous or not previous['value']:
+                continue
+            change = (current['value'] - previous['value']) / previous['value']
+            worse = change if current['better'] == 'lower' else -change
+            flag = '  REGRESSION' if worse > threshold else ''
+            print(f"{suite + '.' + name:<44}{previous['value']:>12.2f}{current['value']:>12.2f}{change:>+8.0%}{flag}")
+            if worse > threshold:
+                regressions.append(f"{suite}.{name}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--suite', action='append', choices=SUITES,
+                        help='suite to run; repeat for several (default: all)')
+    parser.add_argument('--iterations', type=int, default=20000, help='calls per timing run')
+    parser.add_argument('--packets', type=int, default=5000, help='packets per type in the receive suite')
+    parser.add_argument('--broker', metavar='HOST[:PORT]',
+                        help='publish through a real broker in the receive suite instead of the fake client')
+    parser.add_argument('--hours', type=int, default=72, help='simulated event length for the memory suite')
+    parser.add_argument('--event-rate', type=int, default=2000, help='packets per simulated hour')
+    parser.add_argument('--event-nodes', type=int, default=2000, help='distinct nodes seen during the event')
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='allowed slowdown before a metric counts as a regression (default: 0.15)')
+    args = parser.parse_args()
+
+    # Per-packet INFO logging would dominate the timings and flood the terminal
+    logging.getLogger().setLevel(logging.WARNING)
+    mqtt_bridge.logger.setLevel(logging.WARNING)
+
+    results = {}
+    for suite in args.suite or SUITES:
+        print(f"\n== {suite} ==")
+        results[suite] = globals()[f"suite_{suite}"](args)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'machine': platform.machine(),
+        'node': platform.node(),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as previous:
+            regressions = compare(results, json.load(previous), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Simulated Meshtastic radios for running the MQTT bridge without hardware
+SimulatedInterface stands in for meshtastic.serial_interface.SerialInterface:
+it fills .nodes and publishes the same pubsub messages, with synthetic
+TEXT/NODEINFO/POSITION/TELEMETRY traffic or a replayed capture (the
+bridge's own --capture files, or JSONL).
+
+    python mqtt_bridge.py --simulate 400 --rate 50 --duplicates 0.3
+    python mqtt_bridge.py --replay defcon.mcap --speed 10
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+
+from pubsub import pub
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_NUM = 0xFFFFFFFF
+
+HW_MODELS = ['HELTEC_V3', 'T_DECK', 'TBEAM', 'RAK4631', 'T_ECHO', 'STATION_G2', 'HELTEC_WIRELESS_TRACKER']
+
+# (portnum, weight) - roughly what a busy conference mesh looks like
+PORT_MIX = [
+    ('TELEMETRY_APP', 45),
+    ('POSITION_APP', 25),
+    ('NODEINFO_APP', 15),
+    ('TEXT_MESSAGE_APP', 15),
+]
+
+TEXTS = [
+    "Anyone at the HRV booth?",
+    "Testing from the Sphere 📡",
+    "CQ CQ DefCon mesh",
+    "Signal report please",
+    "Heading to the contest area",
+    "Who's running the T-Deck?",
+    "73 from the LVCC",
+    "Battery at 20%, going quiet",
+]
+
+# Near the Las Vegas Convention Center
+BASE_LATITUDE = 36.1316
+BASE_LONGITUDE = -115.1510
+
+
+class SimulationConfig:
+    """Knobs for a simulated mesh"""
+
+    def __init__(self, nodes=40, rate=2.0, duplicate_ratio=0.2, burst_interval=0.0, burst_size=0,
+                 seed=1, replay=None, speed=1.0, replay_from=0.0, max_gap=60.0):
+        self.nodes = nodes                      # Nodes in the mesh
+        self.rate = rate                        # Mean packets per second across the mesh (Poisson)
+        self.duplicate_ratio = duplicate_ratio  # Fraction of packets heard again as a rebroadcast
+        self.burst_interval = burst_interval    # Seconds between bursts; 0 disables them
+        self.burst_size = burst_size            # Extra back-to-back packets per burst
+        self.seed = seed
+        self.replay = replay                    # Capture to replay instead of synthetic traffic
+        self.speed = speed                      # Replay speed multiplier; 0 replays as fast as possible
+        self.replay_from = replay_from          # Seconds into the capture to start from
+        self.max_gap = max_gap                  # Longer pauses in the capture are cut to this; 0 keeps them
+
+
+class SimulatedNode:
+    __slots__ = ('num', 'short_name', 'long_name', 'hw_model', 'latitude', 'longitude', 'altitude',
+                 'battery_level', 'voltage')
+
+    def __init__(self, num, rng):
+        self.num = num
+        self.short_name = f"{num & 0xFFFF:04x}"
+        self.long_name = f"Sim {self.short_name}"
+        self.hw_model = rng.choice(HW_MODELS)
+        self.latitude = BASE_LATITUDE + rng.uniform(-0.01, 0.01)
+        self.longitude = BASE_LONGITUDE + rng.uniform(-0.01, 0.01)
+        self.altitude = rng.randint(600, 700)
+        self.battery_level = rng.randint(20, 100)
+        self.voltage = round(3.3 + self.battery_level / 100, 2)
+
+    @property
+    def node_id(self):
+        return f"!{self.num:08x}"
+
+    def user(self):
+        return {
+            'id': self.node_id,
+            'longName': self.long_name,
+            'shortName': self.short_name,
+            'hwModel': self.hw_model,
+        }
+
+
+class SimulatedMesh:
+    """A deterministic population of nodes and the packets they send
+
+    The node set and the packet contents depend only on the seed, so a
+    load test can be rerun against the same traffic. One emitter thread
+    drives the whole mesh while any radio is open and every radio hears
+    each packet, so config.rate is the mesh's rate however many radios
+    are simulated.
+    """
+
+    def __init__(self, config, emitter=None):
+        self.config = config
+        self.emitter = emitter  # Callable run on the mesh thread with the mesh
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.nodes = [SimulatedNode(0x10000000 + self.rng.getrandbits(24), self.rng) for _ in range(config.nodes)]
+        self.next_id = self.rng.getrandbits(31)
+        self.interfaces = []  # Open SimulatedInterfaces; each packet goes to all of them
+        self.thread = None
+
+    def attach(self, interface):
+        """Add a radio, starting the emitter thread if the mesh was idle"""
+        with self.lock:
+            self.interfaces.append(interface)
+            if self.thread is None and self.emitter is not None:
+                self.thread = threading.Thread(target=self.run, name="sim-mesh", daemon=True)
+                self.thread.start()
+
+    def detach(self, interface):
+        """Remove a radio; the emitter thread stops once none are left"""
+        with self.lock:
+            if interface in self.interfaces:
+                self.interfaces.remove(interface)
+
+    def run(self):
+        try:
+            self.emitter(self)
+        except Exception:
+            logger.exception("Simulated mesh stopped")
+        with self.lock:
+            if self.thread is threading.current_thread():
+                self.thread = None
+
+    def active(self):
+        """True while radios are listening; otherwise releases the emitter thread"""
+        with self.lock:
+            if self.interfaces:
+                return True
+            if self.thread is threading.current_thread():
+                self.thread = None
+            return False
+
+    def sleep_until(self, deadline):
+        """Sleep until a monotonic deadline; False once the last radio closed"""
+        while self.active():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.5))
+        return False
+
+    def broadcast(self, packet):
+        """Deliver a packet to every open radio"""
+        with self.lock:
+            listeners = list(self.interfaces)
+        for interface in listeners:
+            interface.send(packet)
+
+    def send_with_duplicate(self, packet):
+        """Broadcast a packet and maybe a rebroadcast of it heard by one radio"""
+        self.broadcast(packet)
+        if self.wants_duplicate():
+            copy, listener = self.rebroadcast(packet)
+            if listener is not None:
+                listener.send(copy)
+
+    def node_db(self):
+        """Node database in the shape of SerialInterface.nodes"""
+        now = int(time.time())
+        return {
+            node.node_id: {
+                'num': node.num,
+                'user': node.user(),
+                'lastHeard': now,
+                'snr': 5.0,
+                'deviceMetrics': {'batteryLevel': node.battery_level, 'voltage': node.voltage},
+            }
+            for node in self.nodes
+        }
+
+    def make_packet(self):
+        """One new packet from a random node"""
+        with self.lock:
+            rng = self.rng
+            node = rng.choice(self.nodes)
+            portnum = rng.choices([port for port, _ in PORT_MIX], [weight for _, weight in PORT_MIX])[0]
+            self.next_id = (self.next_id + 1) & 0x7FFFFFFF
+            hop_start = rng.choice((3, 3, 3, 7))
+            packet = {
+                'from': node.num,
+                'to': BROADCAST_NUM,
+                'id': self.next_id,
+                'channel': 0,
+                'rxTime': int(time.time()),
+                'rxSnr': round(rng.uniform(-12.0, 10.0), 2),
+                'rxRssi': rng.randint(-120, -40),
+                'hopLimit': rng.randint(0, hop_start),
+                'hopStart': hop_start,
+                'fromId': node.node_id,
+                'toId': '^all',
+                'decoded': self._decoded(portnum, node, rng),
+            }
+        return packet
+
+    def _decoded(self, portnum, node, rng):
+        if portnum == 'TEXT_MESSAGE_APP':
+            text = rng.choice(TEXTS)
+            return {'portnum': portnum, 'payload': text.encode('utf-8'), 'text': text}
+        if portnum == 'NODEINFO_APP':
+            return {'portnum': portnum, 'user': node.user()}
+        if portnum == 'POSITION_APP':
+            node.latitude += rng.uniform(-0.0002, 0.0002)
+            node.longitude += rng.uniform(-0.0002, 0.0002)
+            return {'portnum': portnum, 'position': {
+                'latitudeI': int(node.latitude * 1e7),
+                'longitudeI': int(node.longitude * 1e7),
+                'latitude': node.latitude,
+                'longitude': node.longitude,
+                'altitude': node.altitude,
+                'time': int(time.time()),
+            }}
+        node.battery_level = max(0, node.battery_level - rng.choice((0, 0, 0, 1)))
+        return {'portnum': portnum, 'telemetry': {
+            'time': int(time.time()),
+            'deviceMetrics': {
+                'batteryLevel': node.battery_level,
+                'voltage': round(3.3 + node.battery_level / 100, 2),
+                'channelUtilization': round(rng.uniform(1.0, 35.0), 2),
+                'airUtilTx': round(rng.uniform(0.1, 5.0), 2),
+            },
+        }}
+
+    def rebroadcast(self, packet):
+        """The same packet heard again after another hop"""
+        with self.lock:
+            copy = dict(packet)
+            copy['hopLimit'] = max(0, packet.get('hopLimit', 0) - 1)
+            copy['rxSnr'] = round(self.rng.uniform(-12.0, 10.0), 2)
+            copy['rxRssi'] = self.rng.randint(-120, -40)
+            listeners = list(self.interfaces)
+            interface = self.rng.choice(listeners) if listeners else None
+        return copy, interface
+
+    def wants_duplicate(self):
+        with self.lock:
+            return self.rng.random() < self.config.duplicate_ratio
+
+    def interarrival(self):
+        with self.lock:
+            return self.rng.expovariate(self.config.rate)
+
+
+class SimulatedInterface:
+    """Stand-in for SerialInterface, hearing the traffic of a SimulatedMesh
+
+    Messages are published with pubsub from the mesh's emitter thread, like
+    the real interface's reader thread, including while the constructor is
+    still running.
+    """
+
+    def __init__(self, devPath, mesh):
+        self.devPath = devPath
+        self.mesh = mesh
+        self.nodes = mesh.node_db()
+        self.running = True
+        self.packets_sent = 0
+        pub.sendMessage("meshtastic.connection.established", interface=self)
+        mesh.attach(self)
+
+    def send(self, packet):
+        if not self.running:
+            return
+        pub.sendMessage("meshtastic.receive", packet=packet, interface=self)
+        self.packets_sent += 1
+
+    def close(self):
+        self.running = False
+        self.mesh.detach(self)
+
+
+def synthetic_traffic(config):
+    """Emitter producing Poisson traffic with optional bursts and rebroadcasts"""
+    def emit(mesh):
+        next_packet = time.monotonic()
+        next_burst = time.monotonic() + config.burst_interval if config.burst_interval else None
+        while True:
+            if next_burst is not None and next_burst <= next_packet:
+                if not mesh.sleep_until(next_burst):
+                    return
+                for _ in range(config.burst_size):
+                    mesh.send_with_duplicate(mesh.make_packet())
+                next_burst += config.burst_interval
+                continue
+            if not mesh.sleep_until(next_packet):
+                return
+            mesh.send_with_duplicate(mesh.make_packet())
+            next_packet += mesh.interarrival()
+    return emit
+
+
+def load_capture(path, start=0.0):
+    """Read a JSONL capture into (offset seconds, packet) pairs
+
+    Lines are either {"t": seconds, "packet": {...}} or bare packet dicts,
+    in which case rxTime provides the timing. Packets in the first `start`
+    seconds are skipped.
+    """
+    entries = []
+    with open(path, encoding='utf-8') as capture:
+        for line in capture:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'packet' in record:
+                entries.append((float(record.get('t', 0.0)), record['packet']))
+            else:
+                entries.append((float(record.get('rxTime', 0)), record))
+    if entries:
+        origin = entries[0][0] + start
+        entries = [(offset - origin, packet) for offset, packet in entries if offset >= origin]
+    return entries
+
+
+def replayed_traffic(config, source=None):
+    """Emitter replaying a capture at config.speed (0 = as fast as possible)
+
+    Pauses longer than config.max_gap seconds of capture time, such as the
+    night between two sessions of a multi-day capture, are cut short to
+    max_gap. source() returns the (offset seconds, packet) pairs to send, read afresh
+    whenever the mesh starts; by default the JSONL capture is loaded once.
+    A capture already holds what every radio heard, so replay with one.
+    """
+    if source is None:
+        entries = load_capture(config.replay, config.replay_from)
+        source = lambda: entries
+
+    def emit(mesh):
+        started = time.monotonic()
+        sent = 0
+        skipped = 0.0  # Capture seconds cut out of long gaps so far
+        previous = None
+        for offset, packet in source():
+            if previous is not None and config.max_gap and offset - previous > config.max_gap:
+                gap = offset - previous - config.max_gap
+                skipped += gap
+                logger.info(f"Skipping {gap:.0f}s of silence in {config.replay}")
+            previous = offset
+            offset -= skipped
+            if config.speed > 0 and not mesh.sleep_until(started + offset / config.speed):
+                return
+            if not mesh.active():
+                return
+            mesh.broadcast(packet)
+            sent += 1
+        logger.info(f"Replay of {config.replay} finished: {sent} packets")
+    return emit
+
+
+class SimulatedInterfaceLayer:
+    """Drop-in for mqtt_bridge.SerialInterfaceLayer that opens simulated radios"""
+
+    hotplug = False
+    driver_reset = False
+
+    def __init__(self, config, replay_source=None):
+        self.config = config
+        emitter = replayed_traffic(config, replay_source) if config.replay else synthetic_traffic(config)
+        self.mesh = SimulatedMesh(config, emitter)
+
+    def open(self, port):
+        return SimulatedInterface(port, self.mesh)
+
+    def exists(self, port):
+        return True
+
+    def discover(self):
+        return []
@@ -5,6 +5,12 @@ Listens to Meshtastic packets and forwards them to MQTT
 For DefCon 33 Ham Radio Village - Enhanced for reliability
 """
 
+import argparse
+import asyncio
+import base64
+import bisect
+import ctypes
+import ctypes.util
 import json
 import time
 import logging
@@ -18,77 +24,2453 @@ import signal
 import sys
 import os
 import glob
+import queue
+import random
+import select
+import sqlite3
+import struct
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Configuration
 MQTT_BROKER = "localhost"  # Change to your MQTT broker IP
 MQTT_PORT = 1883
 MQTT_TOPIC_PREFIX = "meshtastic"
+BINARY_TOPIC_PREFIX = "meshtastic-bin"  # Packets again as compact CBOR for dashboards that use it; None disables
 SERIAL_PORT = "/dev/ttyUSB0"  # Change to match your Heltec V3 port (Windows: COM3, etc.)
+SERIAL_PORTS = [SERIAL_PORT]  # One entry per radio, e.g. [SERIAL_PORT, "/dev/ttyUSB1"]
+DEDUPE_WINDOW = 30            # Seconds a (from, id) pair is remembered to drop rebroadcasts and cross-radio copies
+DEDUPE_CACHE_SIZE = 4096      # Upper bound on remembered pairs
+DEVICE_USB_IDS = [            # (VID, PID) of radios to find when a configured port disappears or moves
+    (0x10C4, 0xEA60),         # Silicon Labs CP210x (Heltec V3)
+    (0x1A86, 0x55D4),         # WCH CH9102 (Heltec V3.2, T-Beam)
+    (0x303A, 0x1001),         # ESP32-S3 native USB (T-Deck, Heltec V3 without UART bridge)
+]
+
+# Runtime
+RUNTIME_MODE = "threads"  # Or "asyncio": one event loop drives MQTT, heartbeats and publishing
 
 # Connection monitoring
 CONNECTION_TIMEOUT = 300  # 5 minutes without packets = reconnect
 HEARTBEAT_INTERVAL = 60   # Check connection every minute
-RECONNECT_DELAY = 10      # Wait 10 seconds between reconnection attempts
-MAX_RECONNECT_ATTEMPTS = 5  # Try 5 times before longer delay
+RECONNECT_DELAY = 10      # First retry delay; doubles after each failed reopen
+RECONNECT_MAX_DELAY = 300  # Backoff cap, also the cooldown after a full cycle incl. driver reset fails
+RECONNECT_JITTER = 0.25    # Each delay is shortened by up to this fraction so radios don't retry in lockstep
+MAX_RECONNECT_ATTEMPTS = 5  # Failed reopens before resetting the USB driver
+DRIVER_SETTLE_DELAY = 2    # Seconds between unloading and reloading the driver
+DEVICE_ENUM_DELAY = 3      # Seconds for the device to re-enumerate after the driver reloads
+HOTPLUG_ENABLED = True     # Watch /dev (pyudev if installed, else inotify) and reconnect as soon as a radio reappears
+HOTPLUG_SETTLE_DELAY = 0.2  # Seconds between a tty appearing and opening it (udev sets permissions first)
+
+# Publishing
+SUMMARY_PUBLISH_INTERVAL = 1.0  # Publish nodes_summary at most once per second
+PUBLISH_QUEUE_SIZE = 1000       # Packets buffered for MQTT before the oldest are dropped
+SHUTDOWN_FLUSH_TIMEOUT = 2.0    # Seconds the asyncio runtime spends writing out queued messages on shutdown
+PUBLISH_RATE_LIMITS = [
+    # (topic filter, messages per second, burst) - each matching topic gets its own bucket
+    (f"{MQTT_TOPIC_PREFIX}/packets", 50, 100),
+    (f"{MQTT_TOPIC_PREFIX}/packets/+", 50, 100),
+    (f"{MQTT_TOPIC_PREFIX}/nodes/+", 1, 2),
+    (f"{MQTT_TOPIC_PREFIX}/nodes_summary", 1, 1),
+    (f"{MQTT_TOPIC_PREFIX}/bridge_status", 5, 20),
+    (f"{MQTT_TOPIC_PREFIX}/history", 1, 1),
+    (f"{MQTT_TOPIC_PREFIX}/duplicates", 1, 2),
+    (f"{MQTT_TOPIC_PREFIX}/latency", 1, 1),
+    (f"{MQTT_TOPIC_PREFIX}/stats", 1, 1),
+    (f"{BINARY_TOPIC_PREFIX}/packets", 50, 100),
+    (f"{BINARY_TOPIC_PREFIX}/packets/+", 50, 100),
+]
+
+PACKET_TOPIC_RULES = [
+    # (topic template filled from packet_data, encoding) - one publish per rule
+    (f"{MQTT_TOPIC_PREFIX}/packets", "json"),
+    (f"{MQTT_TOPIC_PREFIX}/packets/{{message_type}}", "json"),
+] + ([
+    (f"{BINARY_TOPIC_PREFIX}/packets", "cbor"),
+    (f"{BINARY_TOPIC_PREFIX}/packets/{{message_type}}", "cbor"),
+] if BINARY_TOPIC_PREFIX else [])
+
+# Integer keys of the binary packet encoding (index = key); the dashboard has the same list.
+# Only ever append - renumbering breaks dashboards that are already open.
+CBOR_PACKET_KEYS = [
+    'timestamp', 'message_count', 'from_id', 'to_id', 'from_name', 'to_name',
+    'hop_limit', 'hop_start', 'want_ack', 'via_mqtt', 'channel', 'rssi', 'snr', 'rx_time',
+    'port_num', 'message_type', 'text', 'radio', 'packet_id',
+    'latitude', 'longitude', 'altitude', 'battery_level', 'voltage',
+    'channel_utilization', 'air_util_tx', 'user_info',
+]
+
+# Packet ingest
+INGEST_QUEUE_SIZE = 500                     # Raw packets buffered between the radio and the workers
+INGEST_WORKERS = 2                          # Threads decoding and publishing packets
+INGEST_DROP_POLICY = "drop-telemetry-first"  # Or "drop-oldest"
+INGEST_DRAIN_TIMEOUT = 5.0                  # Seconds on shutdown to finish packets already queued
+
+# Recent history snapshot for dashboard backfill (retained on meshtastic/history)
+RECENT_PACKETS_PER_TYPE = 30    # Last packets kept per message type
+RECENT_TEXT_MESSAGES = 50       # Last text messages kept
+RECENT_SIGNAL_SAMPLES = 50      # Last RSSI/SNR samples kept
+RECENT_SNAPSHOT_INTERVAL = 10.0  # Publish the snapshot at most this often (seconds)
+
+# Rolling aggregates for dashboards (retained on meshtastic/stats)
+STATS_WINDOWS = {'1m': 60, '15m': 900, '1h': 3600}  # Window name -> seconds
+STATS_BUCKET_SECONDS = 5         # Bucket width; windows are exact to within one bucket
+STATS_PUBLISH_INTERVAL = 5.0     # Seconds between snapshots
+
+# Packet history (optional SQLite store)
+HISTORY_DB_PATH = None          # e.g. "/home/pi/meshtastic_dashboard/history.db" to keep history
+HISTORY_BATCH_SIZE = 200        # Rows written per transaction
+HISTORY_FLUSH_INTERVAL = 2.0    # Max seconds a row waits before being written
+HISTORY_QUEUE_SIZE = 10000      # Rows buffered for the writer before new ones are dropped
+HISTORY_RETENTION_DAYS = 14     # Delete older rows; None keeps everything
+
+# Raw packet capture (replay it later with --replay)
+CAPTURE_PATH = None             # e.g. "/home/pi/meshtastic_dashboard/defcon.mcap" to record every packet heard
+CAPTURE_FLUSH_INTERVAL = 2.0    # Max seconds a packet waits before being written
+CAPTURE_QUEUE_SIZE = 10000      # Packets buffered for the writer before new ones are dropped
+CAPTURE_INDEX_INTERVAL = 10.0   # Seconds of capture between timestamp index entries
+
+# Metrics (Prometheus text format)
+METRICS_PORT = 9464          # Serve http://<host>:9464/metrics; None disables the endpoint
+METRICS_BIND = "127.0.0.1"   # "0.0.0.0" to let a Prometheus server on another machine scrape it
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+RECONNECT_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+NODE_METRICS_TTL = 3600      # Drop a node's RSSI/SNR series after this many seconds without hearing it
+
+# Latency tracing
+LATENCY_WINDOW = 2048            # Samples kept per stage for p50/p95/p99
+LATENCY_PUBLISH_INTERVAL = 10.0  # Seconds between retained summaries on meshtastic/latency
+DASHBOARD_METRICS_TOPIC = f"{MQTT_TOPIC_PREFIX}/metrics/dashboard"  # Dashboards report render timings here
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO, 
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('/tmp/meshtastic_bridge.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+def safe_json_convert(obj):
+    """Safely convert any object to JSON-serializable format"""
+    if obj is None:
+        return None
+    elif isinstance(obj, (str, int, float, bool)):
+        return obj
+    elif isinstance(obj, (list, tuple)):
+        return [safe_json_convert(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {str(k): safe_json_convert(v) for k, v in obj.items()}
+    elif hasattr(obj, '__dict__'):
+        # Handle objects with attributes (like User objects)
+        result = {}
+        for attr_name in dir(obj):
+            if not attr_name.startswith('_'):  # Skip private attributes
+                try:
+                    attr_value = getattr(obj, attr_name)
+                    if not callable(attr_value):  # Skip methods
+                        result[attr_name] = safe_json_convert(attr_value)
+                except:
+                    continue
+        return result
+    else:
+        # Fallback: convert to string
+        return str(obj)
+
+class CompactJSONEncoder:
+    """JSON encoder shared by every topic the bridge publishes
+
+    One prebuilt C-accelerated JSONEncoder with ensure_ascii=False and no
+    circular check, so the bridge's dicts of plain scalars are encoded with
+    no recursive walk. Anything the encoder doesn't know, such as a raw
+    decoded `user`, reaches safe_json_convert through its default hook in
+    the same pass. Output matches json.dumps(safe_json_convert(d),
+    ensure_ascii=False).
+    """
+
+    def __init__(self):
+        self.encoder = json.JSONEncoder(ensure_ascii=False, check_circular=False, default=safe_json_convert)
+
+    def encode(self, data):
+        try:
+            return self.encoder.encode(data)
+        except (TypeError, ValueError):
+            # Keys json can't encode, which safe_json_convert turns into strings
+            return self.encoder.encode(safe_json_convert(data))
+
+PACKET_ENCODER = NODE_ENCODER = STATUS_ENCODER = CompactJSONEncoder()
+
+class CompactCBOREncoder:
+    """CBOR (RFC 8949) encoder for the binary topic tree
+
+    Top-level field names found in the key table go on the wire as small
+    integers (one byte each) and floats that survive the round trip are
+    sent as 4-byte singles. Other keys, and everything in nested maps, stay
+    text. Values outside the plain JSON types go through safe_json_convert,
+    so a decoded packet carries the same values as its JSON twin.
+    """
+
+    def __init__(self, keys):
+        self.keys = {name: self._head(0, index) for index, name in enumerate(keys)}
+
+    @staticmethod
+    def _head(major, value):
+        """Initial byte plus argument for a major type"""
+        if value < 24:
+            return bytes((major << 5 | value,))
+        if value < 0x100:
+            return struct.pack('>BB', major << 5 | 24, value)
+        if value < 0x10000:
+            return struct.pack('>BH', major << 5 | 25, value)
+        if value < 0x100000000:
+            return struct.pack('>BI', major << 5 | 26, value)
+        return struct.pack('>BQ', major << 5 | 27, value)
+
+    def encode(self, data):
+        out = [self._head(5, len(data))]
+        for key, value in data.items():
+            head = self.keys.get(key)
+            if head is None:
+                self._item(str(key), out)
+            else:
+                out.append(head)
+            self._item(value, out)
+        return b''.join(out)
+
+    def _item(self, value, out):
+        if isinstance(value, str):
+            encoded = value.encode('utf-8')
+            out.append(self._head(3, len(encoded)))
+            out.append(encoded)
+        elif isinstance(value, bool):
+            out.append(b'\xf5' if value else b'\xf4')
+        elif isinstance(value, int):
+            if not -2**64 <= value < 2**64:
+                self._item(float(value), out)
+            elif value >= 0:
+                out.append(self._head(0, value))
+            else:
+                out.append(self._head(1, -1 - value))
+        elif isinstance(value, float):
+            try:
+                single = struct.pack('>f', value)
+            except OverflowError:
+                single = None
+            if single is not None and struct.unpack('>f', single)[0] == value:
+                out.append(b'\xfa' + single)
+            else:
+                out.append(b'\xfb' + struct.pack('>d', value))
+        elif value is None:
+            out.append(b'\xf6')
+        elif isinstance(value, dict):
+            out.append(self._head(5, len(value)))
+            for key, item in value.items():
+                self._item(str(key), out)
+                self._item(item, out)
+        elif isinstance(value, (list, tuple)):
+            out.append(self._head(4, len(value)))
+            for item in value:
+                self._item(item, out)
+        else:
+            self._item(safe_json_convert(value), out)
+
+PACKET_CBOR_ENCODER = CompactCBOREncoder(CBOR_PACKET_KEYS)
+
+# Encodings a PreparedMessage can produce, by name: packet_data -> bytes
+MESSAGE_ENCODINGS = {
+    'json': lambda data: PACKET_ENCODER.encode(data).encode('utf-8'),
+    'cbor': PACKET_CBOR_ENCODER.encode,
+}
+
+class _TopicFields(dict):
+    """format_map() helper: missing packet fields render as 'unknown'"""
+
+    def __missing__(self, key):
+        return 'unknown'
+
+class PreparedMessage:
+    """A packet encoded once and shared by every sink that publishes it
+
+    The JSON payload is encoded when the message is created; alternative
+    encodings are produced on first use and cached. The topic rules decide
+    which topics the message fans out to and in which encoding, so adding
+    destinations never re-encodes the packet.
+    """
+
+    __slots__ = ('data', 'payload', 'topic_rules', '_encodings')
+
+    def __init__(self, data, topic_rules=PACKET_TOPIC_RULES):
+        self.data = data
+        self.topic_rules = topic_rules
+        self.payload = MESSAGE_ENCODINGS['json'](data)
+        self._encodings = {'json': self.payload}
+
+    def encoding(self, name):
+        """Payload bytes in the named encoding, created lazily"""
+        payload = self._encodings.get(name)
+        if payload is None:
+            payload = self._encodings[name] = MESSAGE_ENCODINGS[name](self.data)
+        return payload
+
+    def fan_out(self):
+        """Yield (topic, payload) for every topic rule"""
+        fields = _TopicFields(self.data)
+        for template, encoding in self.topic_rules:
+            yield template.format_map(fields), self.encoding(encoding)
+
+def node_num_from_id(node_id):
+    """Convert a '!xxxxxxxx' node ID (or bare hex) to its 32-bit node number"""
+    return int(node_id.lstrip('!'), 16)
+
+def node_id_from_num(node_num):
+    """Convert a 32-bit node number to its '!xxxxxxxx' node ID"""
+    return f"!{node_num:08x}"
+
+class NodeRecord:
+    """Everything the bridge knows about one node, without a per-node dict"""
+
+    __slots__ = ('num', 'short_name', 'long_name', 'hw_model', 'last_heard', 'snr',
+                 'battery_level', 'voltage', 'channel_utilization', 'air_util_tx')
+
+    def __init__(self, num):
+        self.num = num
+        self.short_name = 'UNK'
+        self.long_name = 'Unknown'
+        self.hw_model = 'Unknown'
+        self.last_heard = 0
+        self.snr = 0
+        self.battery_level = 0
+        self.voltage = 0.0
+        self.channel_utilization = 0.0
+        self.air_util_tx = 0.0
+
+    @property
+    def node_id(self):
+        return node_id_from_num(self.num)
+
+    def to_dict(self):
+        """The node_data document published on nodes/<id> and nodes_summary"""
+        return {
+            'node_id': self.node_id,
+            'short_name': self.short_name,
+            'long_name': self.long_name,
+            'hw_model': self.hw_model,
+            'last_heard': self.last_heard,
+            'snr': self.snr,
+            'battery_level': self.battery_level,
+            'voltage': self.voltage,
+            'channel_utilization': self.channel_utilization,
+            'air_util_tx': self.air_util_tx,
+        }
+
+class NodeTable:
+    """Node records keyed by 32-bit node number, with a short name index"""
+
+    def __init__(self):
+        self.records = {}        # num -> NodeRecord
+        self.by_short_name = {}  # short_name -> set of nums
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, num):
+        return num in self.records
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def get(self, num):
+        return self.records.get(num)
+
+    def get_or_create(self, num):
+        record = self.records.get(num)
+        if record is None:
+            record = self.records[num] = NodeRecord(num)
+            self.by_short_name.setdefault(record.short_name, set()).add(num)
+        return record
+
+    def set_short_name(self, record, short_name):
+        """Rename a node, keeping the short name index in step"""
+        if short_name == record.short_name:
+            return
+        nums = self.by_short_name.get(record.short_name)
+        if nums is not None:
+            nums.discard(record.num)
+            if not nums:
+                del self.by_short_name[record.short_name]
+        record.short_name = short_name
+        self.by_short_name.setdefault(short_name, set()).add(record.num)
+
+    def find_by_short_name(self, short_name):
+        """All records currently using a short name"""
+        return [self.records[num] for num in self.by_short_name.get(short_name, ())]
+
+    def memory_report(self):
+        """Approximate bytes held by the table, its records and their strings
+
+        Walks every record, so callers sharing the table with the ingest
+        workers must hold the bridge's state_lock.
+        """
+        records = sum(sys.getsizeof(record) for record in self.records.values())
+        strings = sum(sys.getsizeof(record.short_name) + sys.getsizeof(record.long_name)
+                      + sys.getsizeof(record.hw_model) for record in self.records.values())
+        index = sys.getsizeof(self.by_short_name) + sum(
+            sys.getsizeof(nums) for nums in self.by_short_name.values())
+        total = sys.getsizeof(self.records) + records + strings + index
+        return {
+            'nodes': len(self.records),
+            'total_bytes': total,
+            'record_bytes': records,
+            'string_bytes': strings,
+            'index_bytes': index,
+            'bytes_per_node': total // len(self.records) if self.records else 0,
+        }
+
+def start_thread_timer(delay, callback):
+    """Run callback after delay on a daemon thread; returns a cancellable handle"""
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+class LoopTimer:
+    """Cancellable one-shot timer on an asyncio loop, startable from any thread"""
+
+    def __init__(self, loop, delay, callback):
+        self.handle = None
+        self.cancelled = False
+        loop.call_soon_threadsafe(self._arm, loop, delay, callback)
+
+    def _arm(self, loop, delay, callback):
+        if not self.cancelled:
+            self.handle = loop.call_later(delay, callback)
+
+    def cancel(self):
+        self.cancelled = True
+        if self.handle is not None:
+            self.handle.cancel()
+
+class NodeSummaryPublisher:
+    """Incrementally maintained nodes_summary document
+
+    Keeps the serialized JSON fragment of every node so a node update only
+    re-encodes that node. Updates mark the node dirty and the summary is
+    published at most once per interval, coalescing bursts such as the
+    startup node database refresh.
+    """
+
+    def __init__(self, publish, encode_node, interval=SUMMARY_PUBLISH_INTERVAL, state_lock=None):
+        self.publish = publish          # callable(payload) that sends the summary
+        self.encode_node = encode_node  # callable(node_num) -> JSON fragment or None
+        self.interval = interval
+        self.fragments = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.state_lock = state_lock or threading.RLock()  # Lock encode_node takes; always acquired before ours
+        self.start_timer = start_thread_timer
+        self.timer = None
+        self.last_publish = 0.0
+
+    def update(self, node_num, fragment=None):
+        """Record a node change; pass the fragment if it is already encoded"""
+        with self.lock:
+            if fragment is not None:
+                self.fragments[node_num] = fragment
+                self.dirty.discard(node_num)
+            else:
+                self.dirty.add(node_num)
+            self._schedule()
+
+    def _schedule(self):
+        """Arm the flush timer if one isn't already pending (lock held)"""
+        if self.timer is not None:
+            return
+        delay = max(0.0, self.last_publish + self.interval - time.time())
+        self.timer = self.start_timer(delay, self.flush)
+
+    def flush(self):
+        """Re-encode dirty nodes and publish the coalesced summary"""
+        # update() is called with the state lock held, so take it first here too rather than
+        # letting encode_node take it while we hold ours
+        with self.state_lock, self.lock:
+            self.timer = None
+            for node_num in self.dirty:
+                fragment = self.encode_node(node_num)
+                if fragment is None:
+                    self.fragments.pop(node_num, None)
+                else:
+                    self.fragments[node_num] = fragment
+            self.dirty.clear()
+            fragments = list(self.fragments.values())
+            self.last_publish = time.time()
+
+        updated = json.dumps(datetime.now().isoformat())
+        payload = (f'{{"total_nodes": {len(fragments)}, "nodes": [{", ".join(fragments)}], '
+                   f'"updated": {updated}}}')
+        try:
+            self.publish(payload)
+        except Exception as e:
+            logger.error(f"Error publishing node summary: {e}")
+
+    def stop(self):
+        """Publish any pending changes now instead of waiting for the flush timer"""
+        with self.lock:
+            pending = self.timer is not None
+            if pending:
+                self.timer.cancel()
+                self.timer = None
+        if pending:
+            self.flush()
+
+class RecentHistory:
+    """Bounded in-memory history published as a retained snapshot
+
+    Keeps the last packets per message type, the last text messages and the
+    last signal samples as already-encoded JSON fragments. A compacted
+    snapshot is published on a retained topic at most once per interval, so
+    a dashboard that (re)connects gets instant backfill.
+    """
+
+    def __init__(self, publish, interval=RECENT_SNAPSHOT_INTERVAL, per_type=RECENT_PACKETS_PER_TYPE,
+                 texts=RECENT_TEXT_MESSAGES, signals=RECENT_SIGNAL_SAMPLES):
+        self.publish = publish  # callable(payload) that sends the snapshot
+        self.interval = interval
+        self.per_type = per_type
+        self.packets = {}  # message_type -> deque of JSON fragments
+        self.texts = deque(maxlen=texts)
+        self.signals = deque(maxlen=signals)
+        self.lock = threading.Lock()
+        self.start_timer = start_thread_timer
+        self.timer = None
+        self.last_publish = 0.0
+
+    def add(self, message):
+        """Record a prepared packet"""
+        data = message.data
+        fragment = message.payload.decode('utf-8')
+        msg_type = data.get('message_type', 'unknown')
+        signal_sample = None
+        if data.get('rssi'):
+            signal_sample = json.dumps({
+                'time': time.time(),
+                'rssi': data['rssi'],
+                'snr': data.get('snr', 0),
+                'node': data.get('from_name') or data.get('from_id'),
+            }, ensure_ascii=False)
+        with self.lock:
+            if msg_type == 'text':
+                self.texts.append(fragment)
+            else:
+                ring = self.packets.get(msg_type)
+                if ring is None:
+                    ring = self.packets[msg_type] = deque(maxlen=self.per_type)
+                ring.append(fragment)
+            if signal_sample:
+                self.signals.append(signal_sample)
+            self._schedule()
+
+    def _schedule(self):
+        """Arm the publish timer if one isn't already pending (lock held)"""
+        if self.timer is not None:
+            return
+        delay = max(0.0, self.last_publish + self.interval - time.time())
+        self.timer = self.start_timer(delay, self.flush)
+
+    def snapshot(self):
+        """The compacted history document as a JSON string"""
+        with self.lock:
+            packets = ', '.join(f'{json.dumps(msg_type)}: [{", ".join(ring)}]'
+                                for msg_type, ring in self.packets.items())
+            texts = ', '.join(self.texts)
+            signals = ', '.join(self.signals)
+        updated = json.dumps(datetime.now().isoformat())
+        return (f'{{"packets": {{{packets}}}, "texts": [{texts}], "signals": [{signals}], '
+                f'"updated": {updated}}}')
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+            self.last_publish = time.time()
+        try:
+            self.publish(self.snapshot())
+        except Exception as e:
+            logger.error(f"Error publishing recent history: {e}")
+
+    def stop(self):
+        """Cancel any pending publish"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+class StatsBucket:
+    """Packet counts and signal sums for one slice of time"""
+
+    __slots__ = ('start', 'counts', 'signal_count', 'rssi_sum', 'snr_sum', 'hop_sum')
+
+    def __init__(self, start):
+        self.start = start
+        self.counts = {}  # message_type -> packets
+        self.signal_count = 0
+        self.rssi_sum = 0.0
+        self.snr_sum = 0.0
+        self.hop_sum = 0
+
+    def merge(self, other):
+        for msg_type, count in other.counts.items():
+            self.counts[msg_type] = self.counts.get(msg_type, 0) + count
+        self.signal_count += other.signal_count
+        self.rssi_sum += other.rssi_sum
+        self.snr_sum += other.snr_sum
+        self.hop_sum += other.hop_sum
+
+class RollingStats:
+    """Windowed packet aggregates published as a retained snapshot
+
+    Packets are counted into fixed-width time buckets holding per-type
+    counts and RSSI/SNR/hop sums, so adding a packet is O(1) and a window's
+    aggregate is the sum of its buckets. Nodes are tracked by the time they
+    were last heard and batteries by each node's latest report. Dashboards
+    read the snapshot instead of recomputing it from every packet since they
+    were opened.
+    """
+
+    def __init__(self, windows=STATS_WINDOWS, bucket_seconds=STATS_BUCKET_SECONDS, clock=time.time):
+        self.windows = windows
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock      # Wall-clock source; benchmarks pass a simulated one
+        self.span = max(windows.values())
+        self.buckets = deque()  # StatsBucket, oldest first
+        self.totals = {}        # message_type -> packets since start
+        self.last_heard = {}    # from_id -> time
+        self.batteries = {}     # node name -> (time, battery level)
+        self.started = clock()
+        self.lock = threading.Lock()
+
+    def add(self, data, now=None):
+        """Count one decoded packet (packet_data)"""
+        now = self.clock() if now is None else now
+        msg_type = data.get('message_type', 'unknown')
+        start = now - now % self.bucket_seconds
+        with self.lock:
+            bucket = self.buckets[-1] if self.buckets else None
+            if bucket is None or start > bucket.start:
+                bucket = StatsBucket(start)
+                self.buckets.append(bucket)
+                while self.buckets[0].start + self.bucket_seconds <= now - self.span:
+                    self.buckets.popleft()
+            bucket.counts[msg_type] = bucket.counts.get(msg_type, 0) + 1
+            if data.get('rssi'):
+                bucket.signal_count += 1
+                bucket.rssi_sum += data['rssi']
+                bucket.snr_sum += data.get('snr') or 0
+                bucket.hop_sum += (data.get('hop_start') or 0) - (data.get('hop_limit') or 0)
+            self.totals[msg_type] = self.totals.get(msg_type, 0) + 1
+            if data.get('from_id'):
+                self.last_heard[data['from_id']] = now
+            if data.get('battery_level') is not None:
+                name = data.get('from_name') or data.get('from_id')
+                self.batteries[name] = (now, data['battery_level'])
+
+    def snapshot(self, now=None):
+        """Totals, per-window aggregates and recent batteries as a dict"""
+        now = self.clock() if now is None else now
+        with self.lock:
+            horizon = now - self.span
+            self.last_heard = {node: heard for node, heard in self.last_heard.items() if heard >= horizon}
+            self.batteries = {name: entry for name, entry in self.batteries.items() if entry[0] >= horizon}
+            heard = list(self.last_heard.values())
+            windows = {}
+            for name, seconds in self.windows.items():
+                cutoff = now - seconds
+                window = StatsBucket(cutoff)
+                for bucket in reversed(self.buckets):
+                    if bucket.start + self.bucket_seconds <= cutoff:
+                        break
+                    window.merge(bucket)
+                elapsed = min(seconds, max(now - self.started, 1.0))
+                windows[name] = self._summary(window, elapsed, sum(1 for t in heard if t >= cutoff))
+            totals = dict(self.totals)
+            batteries = {name: level for name, (_, level) in self.batteries.items()}
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'uptime': now - self.started,
+            'totals': {'packets': sum(totals.values()), 'by_type': totals},
+            'windows': windows,
+            'batteries': batteries,
+        }
+
+    @staticmethod
+    def _summary(window, elapsed, active_nodes):
+        packets = sum(window.counts.values())
+        signals = window.signal_count
+        return {
+            'packets': packets,
+            'by_type': window.counts,
+            'packets_per_minute': round(packets * 60 / elapsed, 2),
+            'rates_per_minute': {msg_type: round(count * 60 / elapsed, 2) for msg_type, count in window.counts.items()},
+            'active_nodes': active_nodes,
+            'signal_samples': signals,
+            'avg_rssi': round(window.rssi_sum / signals, 2) if signals else None,
+            'avg_snr': round(window.snr_sum / signals, 2) if signals else None,
+            'avg_hops': round(window.hop_sum / signals, 2) if signals else None,
+        }
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        if now <= self.stamp:
+            return  # Clock read before the bucket was created; nothing to add
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, now):
+        """Consume a token if one is available"""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_time(self, now):
+        """Seconds until the next token is available"""
+        self._refill(now)
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+class PublishScheduler:
+    """Publish stage between the bridge and paho
+
+    Retained/state topics (node records, nodes_summary) are coalesced into a
+    latest-value-wins slot per topic, while event topics such as packets go
+    through a FIFO per topic, bounded together by queue_size. A dispatcher
+    thread drains both, honouring a token bucket per topic, so packet storms
+    can't flood the broker or the dashboards behind it. A throttled topic
+    only holds back its own queue. When the FIFOs are full the drop policy
+    picks the victim, as for PacketQueue: "drop-telemetry-first" discards
+    the oldest message submitted as telemetry before anything else.
+    """
+
+    def __init__(self, get_client, rate_limits=PUBLISH_RATE_LIMITS, queue_size=PUBLISH_QUEUE_SIZE,
+                 drop_policy=INGEST_DROP_POLICY):
+        if drop_policy not in ("drop-oldest", "drop-telemetry-first"):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.get_client = get_client  # callable returning the current paho client
+        self.rate_limits = rate_limits
+        self.drop_policy = drop_policy
+        self.latest = OrderedDict()   # topic -> (payload, retain)
+        self.fifos = OrderedDict()    # topic -> deque of (sequence, topic, payload, retain, trace, telemetry)
+        self.queued = 0               # Messages across all FIFOs
+        self.sequence = 0             # Submission order, kept across topics for flushing
+        self.queue_size = queue_size
+        self.buckets = {}
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.task = None
+        self.loop = None
+        self.wakeup = None
+        self.publish_latency = None  # Optional Histogram of client.publish() time
+        self.tracer = None           # Optional LatencyTracer told the mid of traced messages
+        self.counters = {'sent': 0, 'coalesced': 0, 'dropped': 0, 'failed': 0}
+
+    def start(self, loop=None):
+        """Start the dispatcher: a thread, or a task when given the running event loop"""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        if loop is not None:
+            self.loop = loop
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.dispatch_async())
+        else:
+            self.thread = threading.Thread(target=self.dispatch_loop, name="mqtt-publisher", daemon=True)
+            self.thread.start()
+
+    def stop(self, flush=True):
+        """Stop the dispatcher, optionally sending whatever is still queued"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if flush:
+            with self.cond:
+                pending = [(topic,) + item + (None,) for topic, item in self.latest.items()]
+                pending += [item[1:5] for item in sorted(item for fifo in self.fifos.values() for item in fifo)]
+                self.clear()
+            for topic, payload, retain, trace in pending:
+                self._send(topic, payload, retain, trace)
+
+    def clear(self):
+        """Discard everything queued"""
+        with self.cond:
+            self.latest.clear()
+            self.fifos.clear()
+            self.queued = 0
+
+    def submit(self, topic, payload, retain=False, coalesce=None, trace=None, telemetry=False):
+        """Queue a message; retained topics coalesce unless told otherwise
+
+        A PacketTrace passed with a FIFO message is handed to the tracer
+        with the message id once paho has accepted it. FIFO messages marked
+        as telemetry are dropped first when the queues are full.
+        """
+        if coalesce is None:
+            coalesce = retain
+        with self.cond:
+            if coalesce:
+                if topic in self.latest:
+                    self.counters['coalesced'] += 1
+                self.latest[topic] = (payload, retain)
+            else:
+                if self.queued >= self.queue_size:
+                    self.counters['dropped'] += 1
+                    if not self._evict(telemetry):
+                        return
+                fifo = self.fifos.get(topic)
+                if fifo is None:
+                    fifo = self.fifos[topic] = deque()
+                self.sequence += 1
+                fifo.append((self.sequence, topic, payload, retain, trace, telemetry))
+                self.queued += 1
+            self.cond.notify()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def _evict(self, incoming_telemetry):
+        """Make room for a message; False if the incoming one is the victim (lock held)"""
+        fifos = [fifo for fifo in self.fifos.values() if fifo]
+        if self.drop_policy == "drop-telemetry-first":
+            victim = None  # (sequence, index, fifo) of the oldest telemetry message
+            for fifo in fifos:
+                for index, item in enumerate(fifo):
+                    if item[5]:
+                        if victim is None or item[0] < victim[0]:
+                            victim = (item[0], index, fifo)
+                        break
+            if victim is not None:
+                _, index, fifo = victim
+                del fifo[index]
+                self.queued -= 1
+                return True
+            if incoming_telemetry:
+                return False
+        oldest = min(fifos, key=lambda fifo: fifo[0][0])
+        oldest.popleft()
+        self.queued -= 1
+        return True
+
+    def stats(self):
+        """Snapshot of scheduler counters and queue depths"""
+        with self.cond:
+            return dict(self.counters, queued=self.queued, pending_latest=len(self.latest))
+
+    def _bucket(self, topic):
+        """Token bucket for a topic, or None if it isn't rate limited"""
+        if topic not in self.buckets:
+            bucket = None
+            for topic_filter, rate, burst in self.rate_limits:
+                if mqtt.topic_matches_sub(topic_filter, topic):
+                    bucket = TokenBucket(rate, burst)
+                    break
+            self.buckets[topic] = bucket
+        return self.buckets[topic]
+
+    def _take_ready(self, now):
+        """Pop every message whose bucket allows it (lock held)
+
+        Returns the ready messages and how long to wait for the next token
+        when something is still queued.
+        """
+        ready = []
+        delay = None
+        for topic in list(self.latest):
+            bucket = self._bucket(topic)
+            if bucket is None or bucket.take(now):
+                payload, retain = self.latest.pop(topic)
+                ready.append((topic, payload, retain, None))
+            else:
+                wait = bucket.wait_time(now)
+                delay = wait if delay is None else min(delay, wait)
+        released = []
+        for topic in list(self.fifos):
+            # Keep each topic in order: a throttled head blocks only its own topic
+            fifo = self.fifos[topic]
+            bucket = self._bucket(topic)
+            while fifo and (bucket is None or bucket.take(now)):
+                released.append(fifo.popleft())
+            if fifo:
+                wait = bucket.wait_time(now)
+                delay = wait if delay is None else min(delay, wait)
+            else:
+                del self.fifos[topic]
+        self.queued -= len(released)
+        released.sort()  # Back into submission order across topics
+        ready.extend(item[1:5] for item in released)
+        return ready, delay
+
+    def dispatch_loop(self):
+        """Drain the queues into paho until stopped"""
+        while True:
+            with self.cond:
+                while self.running and not self.queued and not self.latest:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                ready, delay = self._take_ready(time.monotonic())
+                if not ready:
+                    self.cond.wait(delay)
+                    continue
+            for topic, payload, retain, trace in ready:
+                self._send(topic, payload, retain, trace)
+
+    async def dispatch_async(self):
+        """Event-loop version of dispatch_loop"""
+        while True:
+            self.wakeup.clear()
+            with self.cond:
+                if not self.running:
+                    return
+                ready, delay = self._take_ready(time.monotonic())
+            for topic, payload, retain, trace in ready:
+                self._send(topic, payload, retain, trace)
+            if not ready:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(0)
+
+    def _send(self, topic, payload, retain, trace=None):
+        client = self.get_client()
+        if not client:
+            return
+        started = time.perf_counter()
+        try:
+            info = client.publish(topic, payload, retain=retain)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.counters['sent'] += 1
+                if trace is not None and self.tracer:
+                    self.tracer.sent(trace, info.mid)
+            else:
+                self.counters['failed'] += 1
+                logger.debug(f"Publish to {topic} failed: {mqtt.error_string(info.rc)}")
+        except Exception as e:
+            self.counters['failed'] += 1
+            logger.error(f"Error publishing to {topic}: {e}")
+        if self.publish_latency:
+            self.publish_latency.observe(time.perf_counter() - started)
+
+class PacketQueue:
+    """Bounded queue between the Meshtastic reader thread and the workers
+
+    put() never blocks, so a slow broker can't stall serial reads. When the
+    queue is full a packet is discarded according to the drop policy:
+    "drop-oldest" discards the oldest queued packet, "drop-telemetry-first"
+    discards the oldest queued telemetry packet and only falls back to the
+    oldest packet when no telemetry is waiting.
+    """
+
+    def __init__(self, maxsize=INGEST_QUEUE_SIZE, drop_policy=INGEST_DROP_POLICY):
+        if drop_policy not in ("drop-oldest", "drop-telemetry-first"):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.enqueued = 0
+        self.high_water = 0
+        self.dropped = {}  # portnum -> count
+
+    @staticmethod
+    def port_of(packet):
+        decoded = packet.get('decoded') or {}
+        return str(decoded.get('portnum', 'ENCRYPTED' if 'encrypted' in packet else 'UNKNOWN'))
+
+    def put(self, packet, radio=None, trace=None):
+        """Enqueue a packet, the radio it came from and its trace, dropping one if the queue is full"""
+        item = (packet, radio, trace)
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.items) >= self.maxsize:
+                victim = self._evict(item)
+                port = self.port_of(victim[0])
+                self.dropped[port] = self.dropped.get(port, 0) + 1
+                if victim is item:
+                    return
+            self.items.append(item)
+            self.enqueued += 1
+            self.high_water = max(self.high_water, len(self.items))
+            self.cond.notify()
+
+    def _evict(self, incoming):
+        """Remove and return the packet to drop (lock held)"""
+        if self.drop_policy == "drop-telemetry-first":
+            for index, queued in enumerate(self.items):
+                if self.port_of(queued[0]) == 'TELEMETRY_APP':
+                    del self.items[index]
+                    return queued
+            if self.port_of(incoming[0]) == 'TELEMETRY_APP':
+                return incoming
+        return self.items.popleft()
+
+    def get(self):
+        """Block until a (packet, radio, trace) item is available; returns None once closed"""
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait()
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def get_nowait(self):
+        """Next (packet, radio, trace) item, or None if the queue is empty"""
+        with self.cond:
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        """Stop accepting packets; workers get the rest, then None"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def discard(self):
+        """Drop whatever is still queued; returns how many packets that was"""
+        with self.cond:
+            count = len(self.items)
+            self.items.clear()
+            return count
+
+    def stats(self):
+        with self.cond:
+            return {
+                'depth': len(self.items),
+                'high_water': self.high_water,
+                'enqueued': self.enqueued,
+                'dropped': sum(self.dropped.values()),
+                'dropped_by_port': dict(self.dropped),
+            }
+
+class PacketHistoryStore:
+    """Optional SQLite sink for every packet and node update
+
+    Rows are queued by the bridge and written by a single writer thread in
+    batched transactions on a WAL-mode database, so the SD card sees a few
+    commits per minute instead of one per packet. Old rows are pruned
+    according to the retention policy.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS packets (
+            id INTEGER PRIMARY KEY,
+            received REAL NOT NULL,
+            rx_time INTEGER,
+            from_id TEXT,
+            to_id TEXT,
+            message_type TEXT,
+            port_num TEXT,
+            channel INTEGER,
+            rssi REAL,
+            snr REAL,
+            hop_limit INTEGER,
+            hop_start INTEGER,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS packets_from_rx_time ON packets (from_id, rx_time);
+        CREATE INDEX IF NOT EXISTS packets_message_type ON packets (message_type);
+        CREATE INDEX IF NOT EXISTS packets_received ON packets (received);
+        CREATE TABLE IF NOT EXISTS node_updates (
+            id INTEGER PRIMARY KEY,
+            received REAL NOT NULL,
+            node_num INTEGER NOT NULL,
+            node_id TEXT NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS node_updates_node ON node_updates (node_num, received);
+        CREATE INDEX IF NOT EXISTS node_updates_received ON node_updates (received);
+    """
+    PACKET_INSERT = """
+        INSERT INTO packets (received, rx_time, from_id, to_id, message_type, port_num,
+                             channel, rssi, snr, hop_limit, hop_start, payload)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    NODE_INSERT = "INSERT INTO node_updates (received, node_num, node_id, payload) VALUES (?, ?, ?, ?)"
+    PRUNE_INTERVAL = 3600  # Seconds between retention sweeps
+
+    def __init__(self, path, batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL,
+                 queue_size=HISTORY_QUEUE_SIZE, retention_days=HISTORY_RETENTION_DAYS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.rows = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.last_prune = 0.0
+
+    def start(self):
+        """Start the writer thread"""
+        self.thread = threading.Thread(target=self.writer_loop, name="history-writer", daemon=True)
+        self.thread.start()
+        logger.info(f"💾 Recording packet history to {self.path}")
+
+    def stop(self):
+        """Write out anything queued and close the database"""
+        if self.thread:
+            try:
+                self.rows.put(None, timeout=5)
+            except queue.Full:
+                logger.warning("History writer not draining, some rows will be lost")
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def _queue(self, row):
+        try:
+            self.rows.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def add_packet(self, message):
+        """Queue a prepared packet; its JSON payload is stored as-is"""
+        data = message.data
+        self._queue((self.PACKET_INSERT, (
+            time.time(), data.get('rx_time'), data.get('from_id'), data.get('to_id'),
+            data.get('message_type'), data.get('port_num'), data.get('channel'),
+            data.get('rssi'), data.get('snr'), data.get('hop_limit'), data.get('hop_start'),
+            message.payload.decode('utf-8'),
+        )))
+
+    def add_node(self, record, payload):
+        """Queue a node update with its already-encoded JSON"""
+        self._queue((self.NODE_INSERT, (time.time(), record.num, record.node_id, payload)))
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'queued': self.rows.qsize()}
+
+    def writer_loop(self):
+        """Collect rows into batches and commit each batch in one transaction"""
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+        except Exception as e:
+            logger.error(f"Failed to open history database {self.path}: {e}")
+            return
+
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self.rows.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            if batch:
+                self.write_batch(conn, batch)
+            self.prune(conn)
+        conn.close()
+
+    def write_batch(self, conn, batch):
+        try:
+            with conn:
+                for statement, params in batch:
+                    conn.execute(statement, params)
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} history rows: {e}")
+
+    def prune(self, conn):
+        """Apply the retention policy at most once per PRUNE_INTERVAL"""
+        if self.retention_days is None or time.time() - self.last_prune < self.PRUNE_INTERVAL:
+            return
+        self.last_prune = time.time()
+        cutoff = self.last_prune - self.retention_days * 86400
+        try:
+            with conn:
+                packets = conn.execute("DELETE FROM packets WHERE received < ?", (cutoff,)).rowcount
+                nodes = conn.execute("DELETE FROM node_updates WHERE received < ?", (cutoff,)).rowcount
+            if packets or nodes:
+                logger.info(f"🧹 Pruned {packets} packets and {nodes} node updates from history")
+        except Exception as e:
+            logger.error(f"Error pruning history: {e}")
+
+def capture_default(obj):
+    """json.dumps fallback for raw packets: bytes survive the round trip, protobufs are dropped"""
+    if isinstance(obj, (bytes, bytearray)):
+        return {'$bytes': base64.b64encode(obj).decode('ascii')}
+    if hasattr(obj, 'SerializeToString'):
+        return None  # The 'raw' protobuf copies duplicate the decoded dict fields
+    return safe_json_convert(obj)
+
+def capture_object_hook(obj):
+    if len(obj) == 1 and '$bytes' in obj:
+        return base64.b64decode(obj['$bytes'])
+    return obj
+
+class PacketCaptureWriter:
+    """Optional append-only recording of every raw packet the radios deliver
+
+    The file is an 8-byte magic followed by one frame per packet: a header
+    (body length, CRC32 of the body, capture time) and a compact JSON body
+    {"radio": ..., "packet": {...}}. A sidecar .idx file holds a (capture
+    time, file offset) pair every CAPTURE_INDEX_INTERVAL seconds so a replay
+    can start part way through without scanning. Like the history store,
+    packets are queued by the reader thread and encoded by a writer thread.
+    """
+
+    MAGIC = b"MSHCAP1\n"
+    FRAME = struct.Struct('<IId')        # body length, crc32, capture time
+    INDEX_ENTRY = struct.Struct('<dQ')   # capture time, offset of the frame
+
+    def __init__(self, path, flush_interval=CAPTURE_FLUSH_INTERVAL, queue_size=CAPTURE_QUEUE_SIZE,
+                 index_interval=CAPTURE_INDEX_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.index_interval = index_interval
+        self.packets = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+
+    def start(self):
+        """Start the writer thread"""
+        self.thread = threading.Thread(target=self.writer_loop, name="capture-writer", daemon=True)
+        self.thread.start()
+        logger.info(f"🎙️ Capturing raw packets to {self.path}")
+
+    def stop(self):
+        """Write out anything queued and close the capture"""
+        if self.thread:
+            try:
+                self.packets.put(None, timeout=5)
+            except queue.Full:
+                logger.warning("Capture writer not draining, some packets will be lost")
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def add(self, packet, radio_name=None):
+        """Queue a raw packet as delivered by the interface"""
+        try:
+            self.packets.put_nowait((time.time(), radio_name, packet))
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'bytes': self.bytes,
+                'queued': self.packets.qsize()}
+
+    def writer_loop(self):
+        """Append frames as they arrive, flushing data then index once per interval"""
+        try:
+            data = open(self.path, 'ab')
+            index = open(self.path + '.idx', 'ab')
+            if data.tell() == 0:
+                data.write(self.MAGIC)
+        except OSError as e:
+            logger.error(f"Failed to open capture file {self.path}: {e}")
+            return
+
+        last_indexed = None
+        stopping = False
+        while not stopping:
+            entries = []
+            deadline = time.monotonic() + self.flush_interval
+            while time.monotonic() < deadline:
+                try:
+                    item = self.packets.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                captured, radio_name, packet = item
+                try:
+                    body = json.dumps({'radio': radio_name, 'packet': packet}, separators=(',', ':'),
+                                      ensure_ascii=False, default=capture_default).encode('utf-8')
+                except Exception as e:
+                    logger.error(f"Error encoding packet for capture: {e}")
+                    continue
+                if last_indexed is None or captured - last_indexed >= self.index_interval:
+                    entries.append(self.INDEX_ENTRY.pack(captured, data.tell()))
+                    last_indexed = captured
+                data.write(self.FRAME.pack(len(body), zlib.crc32(body), captured))
+                data.write(body)
+                self.written += 1
+                self.bytes += self.FRAME.size + len(body)
+            try:
+                data.flush()
+                if entries:
+                    # Only index frames that are already on disk
+                    index.write(b''.join(entries))
+                    index.flush()
+            except OSError as e:
+                logger.error(f"Error writing capture {self.path}: {e}")
+        data.close()
+        index.close()
+
+class PacketCaptureReader:
+    """Reads a capture written by PacketCaptureWriter
+
+    Reading stops at the first truncated or corrupt frame, which is how a
+    capture cut short by a power loss ends.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def is_capture(path):
+        with open(path, 'rb') as capture:
+            return capture.read(len(PacketCaptureWriter.MAGIC)) == PacketCaptureWriter.MAGIC
+
+    def index(self):
+        """(capture time, offset) pairs from the sidecar; empty if it is missing"""
+        try:
+            with open(self.path + '.idx', 'rb') as index:
+                raw = index.read()
+        except OSError:
+            return []
+        entry = PacketCaptureWriter.INDEX_ENTRY
+        return list(entry.iter_unpack(raw[:len(raw) - len(raw) % entry.size]))
+
+    def frames(self, start=0.0):
+        """Yield (capture time, radio name, packet), skipping the first `start` seconds"""
+        frame = PacketCaptureWriter.FRAME
+        with open(self.path, 'rb') as capture:
+            if capture.read(len(PacketCaptureWriter.MAGIC)) != PacketCaptureWriter.MAGIC:
+                raise ValueError(f"{self.path} is not a packet capture")
+            offset = capture.tell()
+            header = capture.read(frame.size)
+            if len(header) < frame.size:
+                return
+            target = frame.unpack(header)[2] + start
+            if start > 0:
+                index = self.index()
+                position = bisect.bisect_right([captured for captured, _ in index], target) - 1
+                if position >= 0:
+                    offset = index[position][1]
+            capture.seek(offset)
+            while True:
+                header = capture.read(frame.size)
+                if len(header) < frame.size:
+                    return
+                length, crc, captured = frame.unpack(header)
+                body = capture.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    logger.warning(f"Capture {self.path} ends with a damaged frame at offset "
+                                   f"{capture.tell() - len(body) - frame.size}")
+                    return
+                if captured < target:
+                    continue
+                record = json.loads(body, object_hook=capture_object_hook)
+                yield captured, record.get('radio'), record['packet']
+
+    def replay(self, start=0.0):
+        """(seconds since the first replayed packet, packet) pairs for the simulator"""
+        origin = None
+        for captured, _, packet in self.frames(start):
+            if origin is None:
+                origin = captured
+            yield captured - origin, packet
+
+class RadioLink:
+    """Connection state for one Meshtastic radio"""
+
+    def __init__(self, port):
+        self.port = port
+        self.name = os.path.basename(port) or port
+        self.interface = None
+        self.last_packet_time = time.time()
+        self.recovery = None  # ReconnectMachine, set up by the bridge
+        self.heartbeat_thread = None
+        self.packets = 0
+        self.duplicates = 0
+
+    def stats(self):
+        return {
+            'port': self.port,
+            'connected': self.interface is not None,
+            'packets': self.packets,
+            'duplicates': self.duplicates,
+            'last_packet_age': round(time.time() - self.last_packet_time, 1),
+            'recovery': self.recovery.stats() if self.recovery else None,
+        }
+
+class ReconnectMachine:
+    """Timer-driven recovery for one radio
+
+    idle -> probing -> reopening -> idle on success, otherwise
+    cooldown -> probing with capped exponential backoff. After
+    MAX_RECONNECT_ATTEMPTS failed reopens the USB driver is reset before
+    the next probe; if that cycle fails too the machine cools down for
+    RECONNECT_MAX_DELAY and starts over. Every step runs from a timer, so
+    the heartbeat keeps checking health and publishing status meanwhile,
+    and each transition is published as a reconnect_state status.
+    """
+
+    IDLE = 'idle'
+    PROBING = 'probing'
+    REOPENING = 'reopening'
+    DRIVER_RESET = 'driver-reset'
+    COOLDOWN = 'cooldown'
+
+    def __init__(self, radio, probe, reopen, unload_driver, load_driver, publish):
+        self.radio = radio
+        self.probe = probe                  # radio -> bool, is the device node present
+        self.reopen = reopen                # radio -> bool, open the serial interface
+        self.unload_driver = unload_driver  # () -> bool, or None when driver resets are impossible
+        self.load_driver = load_driver      # () -> bool
+        self.publish = publish              # publish_status(status_type, value, radio)
+        self.start_timer = start_thread_timer
+        self.lock = threading.Lock()
+        self.state = self.IDLE
+        self.attempt = 0
+        self.driver_reset_done = False
+        self.started = None
+        self.timer = None
+        self.generation = 0  # Bumped on stop so stale timers become no-ops
+        self.recoveries = 0
+        self.last_recovery_seconds = None
+
+    def trigger(self, reason):
+        """Start recovery; returns False if one is already running"""
+        with self.lock:
+            if self.state != self.IDLE:
+                return False
+            self._start(reason)
+            return True
+
+    def _start(self, reason):
+        self.started = time.monotonic()
+        self.attempt = 0
+        self.driver_reset_done = False
+        self._transition(self.PROBING, reason)
+        self._schedule(0, self.probe_step)
+
+    def stop(self):
+        with self.lock:
+            self.generation += 1
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+    def device_appeared(self):
+        """Hotplug: cut a cooldown short, or start recovery for a radio that never connected"""
+        with self.lock:
+            # A cooldown whose timer already fired is probing on its own
+            if self.state == self.COOLDOWN and self.timer is not None:
+                self.generation += 1  # Invalidate the pending cooldown timer
+                self.timer.cancel()
+                self._transition(self.PROBING, "device appeared")
+                self._schedule(HOTPLUG_SETTLE_DELAY, self.probe_step)
+                return True
+            if self.state == self.IDLE and self.radio.interface is None:
+                self._start("device appeared")
+                return True
+            return False
+
+    def backoff(self):
+        """Capped exponential delay for the current attempt, with jitter"""
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2 ** max(self.attempt - 1, 0))
+        return delay * random.uniform(1 - RECONNECT_JITTER, 1)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'attempt': self.attempt,
+            'recoveries': self.recoveries,
+            'last_recovery_seconds': self.last_recovery_seconds,
+        }
+
+    def _schedule(self, delay, step):
+        generation = self.generation
+        self.timer = self.start_timer(delay, lambda: self._run(generation, step))
+
+    def _run(self, generation, step):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.timer = None  # Committed: device_appeared can no longer cancel this step
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"Error in reconnect step on {self.radio.port}: {e}")
+            with self.lock:
+                self._failed(f"error: {e}")
+
+    def _transition(self, state, reason, **extra):
+        previous, self.state = self.state, state
+        info = {
+            'state': state,
+            'previous': previous,
+            'reason': reason,
+            'attempt': self.attempt,
+            'elapsed': round(time.monotonic() - self.started, 3),
+        }
+        info.update(extra)
+        logger.info(f"🔁 {self.radio.name}: {previous} -> {state} ({reason})")
+        self.publish("reconnect_state", info, self.radio)
+
+    def _failed(self, reason):
+        """Pick the next state after a failed probe, reopen or driver step"""
+        if self.attempt >= MAX_RECONNECT_ATTEMPTS and not self.driver_reset_done:
+            self.driver_reset_done = True
+            if self.unload_driver:
+                self._transition(self.DRIVER_RESET, reason)
+                self._schedule(0, self.unload_step)
+                return
+        if self.driver_reset_done:
+            # Full cycle failed: long cooldown, then start counting again
+            delay = RECONNECT_MAX_DELAY * random.uniform(1 - RECONNECT_JITTER, 1)
+            self.attempt = 0
+            self.driver_reset_done = False
+        else:
+            delay = self.backoff()
+        self._transition(self.COOLDOWN, reason, delay=round(delay, 1))
+        self._schedule(delay, self.cooldown_done)
+
+    def cooldown_done(self):
+        with self.lock:
+            self._transition(self.PROBING, "cooldown elapsed")
+            self._schedule(0, self.probe_step)
+
+    def probe_step(self):
+        present = self.probe(self.radio)
+        with self.lock:
+            if present:
+                self._transition(self.REOPENING, "device present")
+                self._schedule(0, self.reopen_step)
+            else:
+                self.attempt += 1
+                self._failed("device missing")
+
+    def reopen_step(self):
+        with self.lock:
+            self.attempt += 1
+        ok = self.reopen(self.radio)
+        with self.lock:
+            if ok:
+                recovery_seconds = round(time.monotonic() - self.started, 3)
+                self.recoveries += 1
+                self.last_recovery_seconds = recovery_seconds
+                self._transition(self.IDLE, "reopened", recovery_seconds=recovery_seconds)
+                self.attempt = 0
+            else:
+                self._failed("reopen failed")
+
+    def unload_step(self):
+        ok = self.unload_driver()
+        with self.lock:
+            if ok:
+                self._schedule(DRIVER_SETTLE_DELAY, self.load_step)
+            else:
+                self._failed("driver unload failed")
+
+    def load_step(self):
+        ok = self.load_driver()
+        with self.lock:
+            if ok:
+                # Stay in driver-reset while the device re-enumerates
+                self._schedule(DEVICE_ENUM_DELAY, self.driver_reset_done_step)
+            else:
+                self._failed("driver reload failed")
+
+    def driver_reset_done_step(self):
+        with self.lock:
+            self._transition(self.PROBING, "driver reset")
+            self._schedule(0, self.probe_step)
+
+class InterfaceGeneration:
+    """One opened SerialInterface of a radio and what it delivered"""
+
+    __slots__ = ('number', 'radio', 'interface', 'opened', 'retired', 'packets', 'node_updates',
+                 'connection_events', 'stale_drops')
+
+    def __init__(self, number, radio):
+        self.number = number
+        self.radio = radio
+        self.interface = None
+        self.opened = time.time()
+        self.retired = None
+        self.packets = 0
+        self.node_updates = 0
+        self.connection_events = 0
+        self.stale_drops = 0  # Deliveries after this generation was replaced or closed
+
+    def to_dict(self):
+        return {
+            'generation': self.number,
+            'radio': self.radio.name,
+            'opened': self.opened,
+            'retired': self.retired,
+            'packets': self.packets,
+            'node_updates': self.node_updates,
+            'connection_events': self.connection_events,
+            'stale_drops': self.stale_drops,
+        }
+
+class SubscriptionManager:
+    """Owns the pubsub subscriptions and maps each delivery to an interface generation
+
+    The meshtastic topics are subscribed once, however often radios
+    reconnect. Every setup_meshtastic opens a new generation for its radio;
+    the interface is bound to it as soon as it delivers (reader threads
+    publish before the SerialInterface constructor returns, so an unknown
+    interface is claimed by devPath). Deliveries from an interface whose
+    generation has been replaced or closed are counted and dropped, which
+    keeps a half-closed reader thread from double-processing packets after
+    the USB link flaps.
+    """
+
+    HISTORY = 50  # Generations kept for stats
+
+    def __init__(self, on_receive, on_connection, on_node_updated):
+        self.on_receive = on_receive
+        self.on_connection = on_connection
+        self.on_node_updated = on_node_updated
+        self.lock = threading.Lock()
+        self.subscribed = False
+        self.next_number = 1
+        self.current = {}  # radio -> live generation
+        self.by_interface = weakref.WeakKeyDictionary()  # interface -> generation, incl. retired
+        self.generations = deque(maxlen=self.HISTORY)
+        self.unknown_drops = 0
+
+    def subscribe(self):
+        """Subscribe the dispatchers to the meshtastic topics; safe to call repeatedly"""
+        with self.lock:
+            if self.subscribed:
+                return
+            self.subscribed = True
+        pub.subscribe(self.deliver_receive, "meshtastic.receive")
+        pub.subscribe(self.deliver_connection, "meshtastic.connection.established")
+        pub.subscribe(self.deliver_node_updated, "meshtastic.node.updated")
+
+    def unsubscribe(self):
+        with self.lock:
+            if not self.subscribed:
+                return
+            self.subscribed = False
+        pub.unsubscribe(self.deliver_receive, "meshtastic.receive")
+        pub.unsubscribe(self.deliver_connection, "meshtastic.connection.established")
+        pub.unsubscribe(self.deliver_node_updated, "meshtastic.node.updated")
+
+    def open(self, radio):
+        """Start a new generation for a radio, retiring the previous one"""
+        with self.lock:
+            self._retire_locked(radio)
+            generation = InterfaceGeneration(self.next_number, radio)
+            self.next_number += 1
+            self.current[radio] = generation
+            self.generations.append(generation)
+            return generation
+
+    def attach(self, generation, interface):
+        """Bind an interface to its generation (no-op if it already claimed it)"""
+        with self.lock:
+            if generation.interface is None:
+                generation.interface = interface
+                self.by_interface[interface] = generation
+
+    def retire(self, radio):
+        """Mark a radio's live generation closed; later deliveries from it are dropped"""
+        with self.lock:
+            self._retire_locked(radio)
+
+    def _retire_locked(self, radio):
+        generation = self.current.pop(radio, None)
+        if generation:
+            generation.retired = time.time()
+            generation.interface = None  # by_interface still recognizes it while it's alive
+
+    def resolve(self, interface):
+        """The live generation an interface belongs to, or None if it is stale or unknown"""
+        with self.lock:
+            try:
+                generation = self.by_interface.get(interface)
+            except TypeError:  # None or not weak-referenceable, so never bound
+                generation = None
+            if generation is None:
+                generation = self._claim_locked(interface)
+                if generation is None:
+                    self.unknown_drops += 1
+                    return None
+            if self.current.get(generation.radio) is not generation:
+                generation.stale_drops += 1
+                return None
+            return generation
+
+    def _claim_locked(self, interface):
+        """Bind an interface that delivers before attach() to the generation opening on its port"""
+        port = getattr(interface, 'devPath', None)
+        pending = [g for g in self.current.values() if g.interface is None]
+        for generation in pending:
+            if generation.radio.port == port or (port is None and interface is not None and len(pending) == 1):
+                generation.interface = interface
+                self.by_interface[interface] = generation
+                return generation
+        return None
+
+    def deliver_receive(self, packet, interface=None):
+        generation = self.resolve(interface)
+        if generation is None:
+            logger.debug("Dropped packet from a stale Meshtastic interface")
+            return
+        generation.packets += 1
+        self.on_receive(packet, generation.radio)
+
+    def deliver_connection(self, interface, topic=pub.AUTO_TOPIC):
+        generation = self.resolve(interface)
+        if generation is None:
+            return
+        generation.connection_events += 1
+        self.on_connection(generation.radio)
+
+    def deliver_node_updated(self, interface, node, topic=pub.AUTO_TOPIC):
+        generation = self.resolve(interface)
+        if generation is None:
+            return
+        generation.node_updates += 1
+        self.on_node_updated(node, generation.radio)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'generations': [generation.to_dict() for generation in self.generations],
+                'unknown_drops': self.unknown_drops,
+            }
+
+def discover_radio_ports():
+    """Serial ports whose USB VID/PID matches DEVICE_USB_IDS"""
+    try:
+        from serial.tools import list_ports
+    except ImportError:
+        return []
+    return sorted(port.device for port in list_ports.comports() if (port.vid, port.pid) in DEVICE_USB_IDS)
+
+def no_new_privileges():
+    """True if the process runs with NoNewPrivileges, so sudo can't elevate"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('NoNewPrivs:'):
+                    return line.split()[1] == '1'
+    except OSError:
+        pass
+    return False
+
+class SerialInterfaceLayer:
+    """How the bridge opens and finds radios: real serial devices
+
+    mesh_simulator.SimulatedInterfaceLayer provides the same methods for
+    running the bridge without hardware.
+    """
+
+    hotplug = True       # Device nodes come and go, so watching /dev is useful
+    driver_reset = True  # The cp210x reset can help
+
+    def open(self, port):
+        return meshtastic.serial_interface.SerialInterface(
+            port,
+            debugOut=None,  # Disable debug output for cleaner logs
+            connectNow=True
+        )
+
+    def exists(self, port):
+        return os.path.exists(port)
+
+    def discover(self):
+        return discover_radio_ports()
+
+class HotplugWatcher:
+    """Reports serial tty add/remove events as on_event(action, device_path)
+
+    Uses pyudev when it is installed and falls back to inotify on /dev
+    through ctypes, so no extra dependency is needed on a Pi. On systems
+    with neither, start() returns False and the heartbeat remains the only
+    detector.
+    """
+
+    TTY_PREFIXES = ('ttyUSB', 'ttyACM')
+    IN_ATTRIB = 0x00000004
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, on_event, directory='/dev'):
+        self.on_event = on_event
+        self.directory = directory
+        self.observer = None
+        self.thread = None
+        self.fd = None
+        self.running = False
+
+    def start(self):
+        try:
+            import pyudev
+        except ImportError:
+            return self.start_inotify()
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by('tty')
+            self.observer = pyudev.MonitorObserver(monitor, callback=self.on_udev_event, name="hotplug")
+            self.observer.start()
+            logger.info("🔌 Watching for radio hotplug via udev")
+            return True
+        except Exception as e:
+            logger.warning(f"udev monitor unavailable ({e}), falling back to inotify")
+            return self.start_inotify()
+
+    def on_udev_event(self, device):
+        if device.device_node and device.action in ('add', 'remove'):
+            self.on_event(device.action, device.device_node)
+
+    def start_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = self.IN_CREATE | self.IN_ATTRIB | self.IN_DELETE
+            if libc.inotify_add_watch(fd, self.directory.encode(), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch {self.directory} failed")
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Hotplug detection unavailable: {e}")
+            return False
+        self.fd = fd
+        self.running = True
+        self.thread = threading.Thread(target=self.inotify_loop, name="hotplug", daemon=True)
+        self.thread.start()
+        logger.info(f"🔌 Watching {self.directory} for radio hotplug via inotify")
+        return True
+
+    def inotify_loop(self):
+        while self.running:
+            try:
+                readable, _, _ = select.select([self.fd], [], [], 1.0)
+                if not readable:
+                    continue
+                data = os.read(self.fd, 4096)
+            except OSError:
+                if self.running:
+                    logger.error("inotify read failed, hotplug detection stopped")
+                return
+            offset = 0
+            while offset + self.EVENT_HEADER.size <= len(data):
+                _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+                offset += length
+                if not name.startswith(self.TTY_PREFIXES):
+                    continue
+                action = 'remove' if mask & self.IN_DELETE else 'add'
+                self.on_event(action, os.path.join(self.directory, name))
+
+    def stop(self):
+        self.running = False
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class SeenPacket:
+    """Dedupe cache entry: the first copy of a packet and its duplicates"""
+
+    __slots__ = ('first_seen', 'from_num', 'packet_id', 'port_num', 'first_radio',
+                 'duplicates', 'best_snr', 'best_rssi', 'best_radio')
+
+    def __init__(self, packet, radio_name, now):
+        self.first_seen = now
+        self.from_num = packet.get('from')
+        self.packet_id = packet.get('id')
+        self.port_num = PacketQueue.port_of(packet)
+        self.first_radio = radio_name
+        self.duplicates = 0
+        self.best_snr = packet.get('rxSnr', 0.0)
+        self.best_rssi = packet.get('rxRssi', 0)
+        self.best_radio = radio_name
+
+    def add_copy(self, packet, radio_name):
+        self.duplicates += 1
+        snr = packet.get('rxSnr', 0.0)
+        if snr > self.best_snr:
+            self.best_snr = snr
+            self.best_rssi = packet.get('rxRssi', 0)
+            self.best_radio = radio_name
+
+    def to_dict(self):
+        return {
+            'from_id': node_id_from_num(self.from_num),
+            'packet_id': self.packet_id,
+            'port_num': self.port_num,
+            'first_seen': datetime.fromtimestamp(self.first_seen).isoformat(),
+            'first_radio': self.first_radio,
+            'duplicates': self.duplicates,
+            'best_snr': self.best_snr,
+            'best_rssi': self.best_rssi,
+            'best_radio': self.best_radio,
+        }
+
+class PacketDeduplicator:
+    """Time-windowed cache of recently seen (from, id) pairs
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/tmp/meshtastic_bridge.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+    Mesh flooding and multiple radios deliver the same packet several
+    times. Only the first copy is passed on; later copies within the window
+    are counted and the best-SNR copy remembered. Entries that saw
+    duplicates are handed back by expire() once their window closes so the
+    bridge can publish a summary.
+    """
 
-def safe_json_convert(obj):
-    """Safely convert any object to JSON-serializable format"""
-    if obj is None:
-        return None
-    elif isinstance(obj, (str, int, float, bool)):
-        return obj
-    elif isinstance(obj, (list, tuple)):
-        return [safe_json_convert(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {str(k): safe_json_convert(v) for k, v in obj.items()}
-    elif hasattr(obj, '__dict__'):
-        # Handle objects with attributes (like User objects)
-        result = {}
-        for attr_name in dir(obj):
-            if not attr_name.startswith('_'):  # Skip private attributes
+    def __init__(self, window=DEDUPE_WINDOW, size=DEDUPE_CACHE_SIZE):
+        self.window = window
+        self.size = size
+        self.seen = OrderedDict()  # (from, id) -> SeenPacket, oldest first
+        self.closed = []           # Entries with duplicates awaiting expire()
+        self.lock = threading.Lock()
+        self.total_duplicates = 0
+
+    def observe(self, packet, radio_name=None, now=None):
+        """True for the first copy of a packet, False for a duplicate"""
+        packet_id = packet.get('id')
+        if not packet_id:
+            return True  # Some packets carry no id; never drop those
+        now = time.time() if now is None else now
+        key = (packet.get('from'), packet_id)
+        with self.lock:
+            self._expire_locked(now)
+            entry = self.seen.get(key)
+            if entry is not None:
+                entry.add_copy(packet, radio_name)
+                self.total_duplicates += 1
+                return False
+            self.seen[key] = SeenPacket(packet, radio_name, now)
+            if len(self.seen) > self.size:
+                self._close(self.seen.popitem(last=False)[1])
+            return True
+
+    def _close(self, entry):
+        if entry.duplicates:
+            self.closed.append(entry)
+
+    def _expire_locked(self, now):
+        cutoff = now - self.window
+        while self.seen:
+            entry = next(iter(self.seen.values()))
+            if entry.first_seen >= cutoff:
+                break
+            self.seen.popitem(last=False)
+            self._close(entry)
+
+    def expire(self, now=None):
+        """Drop entries past the window; returns the ones that saw duplicates"""
+        with self.lock:
+            self._expire_locked(time.time() if now is None else now)
+            closed, self.closed = self.closed, []
+        return closed
+
+class AsyncioMQTT:
+    """Drives a paho client from an asyncio event loop instead of loop_start()
+
+    paho's socket callbacks register its socket with the loop, so reads,
+    writes and keepalives run as loop callbacks and no network thread is
+    started. A dropped broker connection is retried from misc_loop with
+    backoff.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.task = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        if self.task is None:
+            self.task = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        """Keepalives, plus reconnecting when the broker goes away"""
+        delay = 1
+        while True:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
                 try:
-                    attr_value = getattr(obj, attr_name)
-                    if not callable(attr_value):  # Skip methods
-                        result[attr_name] = safe_json_convert(attr_value)
-                except:
-                    continue
+                    self.client.reconnect()
+                    delay = 1
+                except Exception as e:
+                    logger.warning(f"MQTT reconnect failed: {e}")
+                    delay = min(delay * 2, 30)
+            await asyncio.sleep(delay)
+
+    def flush(self, timeout=SHUTDOWN_FLUSH_TIMEOUT):
+        """Write out everything paho has queued, blocking the loop
+
+        Shutdown only: once the loop stops serving the socket, publishes
+        made during cleanup would otherwise never leave paho's queue.
+        """
+        deadline = time.monotonic() + timeout
+        while self.client.want_write():
+            sock = self.client.socket()
+            remaining = deadline - time.monotonic()
+            if sock is None or remaining <= 0:
+                logger.warning("Gave up flushing MQTT with messages still queued")
+                return
+            select.select([], [sock], [], remaining)
+            if self.client.loop_write() != mqtt.MQTT_ERR_SUCCESS:
+                return
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+class PacketTrace:
+    """Monotonic stamps for one packet on its way through the bridge"""
+
+    __slots__ = ('rx_time', 'received_wall', 'received', 'decode_started', 'decoded', 'encoded', 'sent')
+
+    def __init__(self, rx_time=None):
+        self.rx_time = rx_time          # Radio's receive time (epoch seconds, 1 s resolution)
+        self.received_wall = time.time()
+        self.received = time.monotonic()  # Reader callback entry
+        self.decode_started = None
+        self.decoded = None
+        self.encoded = None
+        self.sent = None                # client.publish() returned
+
+class LatencyTracer:
+    """Per-stage packet latency samples and their percentiles
+
+    Bridge stages come from PacketTrace stamps and complete when paho's
+    on_publish reports the packet's mid (for QoS 0 that is when the
+    message has been written to the broker socket). Dashboards report
+    render and delivery times, which are added as their own stages.
+    rx_to_bridge compares the radio's clock with ours, so it is only as
+    good as both clocks and has one second resolution.
+    """
+
+    STAGES = ('rx_to_bridge', 'queue', 'decode', 'encode', 'publish', 'bridge_total', 'delivery', 'render')
+    QUANTILES = (0.5, 0.95, 0.99)
+    PENDING_SIZE = 4096  # Traces waiting for on_publish
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.samples = {stage: deque(maxlen=window) for stage in self.STAGES}
+        self.pending = OrderedDict()  # mid -> PacketTrace
+        self.early_acks = OrderedDict()  # mid -> ack time, for on_publish firing before publish() returns
+
+    def start(self, rx_time=None):
+        return PacketTrace(rx_time)
+
+    def sent(self, trace, mid):
+        trace.sent = time.monotonic()
+        with self.lock:
+            acked = self.early_acks.pop(mid, None)
+            if acked is not None:
+                self._complete(trace, acked)
+                return
+            self.pending[mid] = trace
+            if len(self.pending) > self.PENDING_SIZE:
+                self.pending.popitem(last=False)
+
+    def acked(self, mid):
+        now = time.monotonic()
+        with self.lock:
+            trace = self.pending.pop(mid, None)
+            if trace is not None:
+                self._complete(trace, now)
+                return
+            self.early_acks[mid] = now  # Untraced messages land here too and age out
+            if len(self.early_acks) > self.PENDING_SIZE:
+                self.early_acks.popitem(last=False)
+
+    def _complete(self, trace, acked):
+        """Record every stage of a finished trace (lock held)"""
+        if trace.decode_started is None or trace.encoded is None:
+            return
+        samples = self.samples
+        if trace.rx_time:
+            samples['rx_to_bridge'].append(max(trace.received_wall - trace.rx_time, 0.0))
+        samples['queue'].append(trace.decode_started - trace.received)
+        samples['decode'].append(trace.decoded - trace.decode_started)
+        samples['encode'].append(trace.encoded - trace.decoded)
+        samples['publish'].append(acked - trace.encoded)
+        samples['bridge_total'].append(acked - trace.received)
+
+    def add_samples(self, stage, values):
+        """Add externally measured samples (seconds) to a stage"""
+        with self.lock:
+            self.samples[stage].extend(values)
+
+    def percentiles(self):
+        """{stage: {'count': n, 0.5: seconds, ...}} for stages with samples"""
+        with self.lock:
+            snapshot = {stage: sorted(values) for stage, values in self.samples.items() if values}
+        result = {}
+        for stage, values in snapshot.items():
+            count = len(values)
+            summary = {'count': count}
+            for quantile in self.QUANTILES:
+                summary[quantile] = values[min(count - 1, int(quantile * count))]
+            result[stage] = summary
         return result
-    else:
-        # Fallback: convert to string
-        return str(obj)
 
-class MeshtasticBridge:
+    def collect(self):
+        """(stage, quantile) samples for the metrics registry"""
+        return [((stage, str(quantile)), summary[quantile])
+                for stage, summary in self.percentiles().items() for quantile in self.QUANTILES]
+
+    def summary(self):
+        """Percentiles in milliseconds for the MQTT latency topic"""
+        return {
+            stage: dict({'count': summary['count']},
+                        **{f"p{int(quantile * 100)}_ms": round(summary[quantile] * 1000, 3)
+                           for quantile in self.QUANTILES})
+            for stage, summary in self.percentiles().items()
+        }
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+class Metric:
+    """One labelled metric family
+
+    Values are either kept by the metric (inc/set/observe) or, when
+    collect is given, read at scrape time from a callable returning
+    (label_values, value) pairs, so existing counters in the bridge's
+    stats() helpers can be exported without duplicating them.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        """(name, label pairs, value) for each exported sample"""
+        if self.collect:
+            items = list(self.collect())
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name, list(zip(self.labels, label_values)), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, pairs, value in self.samples():
+            lines.append(f"{name}{format_labels(pairs)} {float(value)!r}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def remove(self, *label_values):
+        with self.lock:
+            self.values.pop(label_values, None)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for label_values, (counts, total, count) in items:
+            pairs = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", pairs + [('le', repr(float(bound)))], cumulative
+            yield f"{self.name}_bucket", pairs + [('le', '+Inf')], count
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, count
+
+class MetricsRegistry:
+    """Metric families rendered together in the Prometheus text exposition format"""
+
     def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=(), collect=None):
+        return self.register(Counter(name, help_text, labels, collect))
+
+    def gauge(self, name, help_text, labels=(), collect=None):
+        return self.register(Gauge(name, help_text, labels, collect))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    """Serves a MetricsRegistry at /metrics from a background HTTP server thread"""
+
+    def __init__(self, registry, port=METRICS_PORT, bind=METRICS_BIND):
+        self.registry = registry
+        self.port = port
+        self.bind = bind
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood the bridge log
+
+        self.server = ThreadingHTTPServer((self.bind, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        logger.info(f"📈 Metrics at http://{self.bind}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+class MeshtasticBridge:
+    def __init__(self, interface_layer=None, serial_ports=None, capture_path=None):
         self.mqtt_client = None
-        self.meshtastic_interface = None
-        self.node_info = {}
+        self.interface_layer = interface_layer or SerialInterfaceLayer()
+        self.radios = [RadioLink(port) for port in (serial_ports or SERIAL_PORTS)]
+        self.dedupe = PacketDeduplicator()
+        self.nodes = NodeTable()
         self.message_count = 0
-        self.last_packet_time = time.time()
         self.running = True
-        self.reconnect_attempts = 0
-        self.heartbeat_thread = None
+        self.loop = None         # Event loop in asyncio mode
+        self.loop_thread = None
+        self.mqtt_io = None
+        self.state_lock = threading.RLock()  # Guards nodes and message_count across workers
+        self.port_lock = threading.Lock()    # Serializes radios claiming a rediscovered port
+        self.ingest = PacketQueue()
+        self.workers = []
+        self.history = PacketHistoryStore(HISTORY_DB_PATH) if HISTORY_DB_PATH else None
+        capture_path = capture_path or CAPTURE_PATH
+        self.capture = PacketCaptureWriter(capture_path) if capture_path else None
+        self.publisher = PublishScheduler(lambda: self.mqtt_client)
+        self.node_summary = NodeSummaryPublisher(self.publish_nodes_summary, self.encode_node_info,
+                                                 state_lock=self.state_lock)
+        self.recent = RecentHistory(self.publish_recent_history)
+        self.rolling_stats = RollingStats()
+        self.last_stats_publish = time.monotonic()
+        self.subscriptions = SubscriptionManager(self.on_receive, self.on_connection, self.on_node_updated)
+        self.hotplug = HotplugWatcher(self.on_hotplug) if HOTPLUG_ENABLED and self.interface_layer.hotplug else None
+        # Under systemd's NoNewPrivileges=true sudo can't run rmmod/modprobe, so skip that step entirely
+        can_reset_driver = self.interface_layer.driver_reset and not no_new_privileges()
+        if self.interface_layer.driver_reset and not can_reset_driver:
+            logger.info("NoNewPrivileges is set, USB driver resets are disabled")
+        for radio in self.radios:
+            radio.recovery = ReconnectMachine(radio, self.probe_radio, self.setup_meshtastic,
+                                              self.unload_usb_driver if can_reset_driver else None,
+                                              self.load_usb_driver, self.report_reconnect_state)
+        self.tracer = LatencyTracer()
+        self.publisher.tracer = self.tracer
+        self.last_latency_publish = time.monotonic()
+        self.metrics = MetricsRegistry()
+        self.metrics_server = None
+        self.setup_metrics()
         
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         
+    def setup_metrics(self):
+        """Register the bridge's metric families; most read existing counters at scrape time"""
+        m = self.metrics
+        self.packets_metric = m.counter('meshtastic_bridge_packets_total', "Decoded packets",
+                                        ('message_type', 'port_num'))
+        self.decode_latency = m.histogram('meshtastic_bridge_decode_seconds', "Time to decode one packet")
+        self.publisher.publish_latency = m.histogram('meshtastic_bridge_mqtt_publish_seconds',
+                                                     "Time spent in one MQTT client.publish() call")
+        m.counter('meshtastic_bridge_mqtt_publish_failures_total', "MQTT publishes that failed or found no connection",
+                  collect=lambda: [((), self.publisher.counters['failed'])])
+        m.counter('meshtastic_bridge_mqtt_messages_total', "MQTT messages by scheduler outcome", ('result',),
+                  collect=lambda: [((result,), count) for result, count in self.publisher.counters.items()])
+        m.gauge('meshtastic_bridge_queue_depth', "Items waiting in internal queues", ('queue',),
+                collect=self.collect_queue_depths)
+        m.counter('meshtastic_bridge_ingest_dropped_total', "Packets dropped by a full ingest queue", ('port_num',),
+                  collect=lambda: [((port,), count) for port, count in self.ingest.stats()['dropped_by_port'].items()])
+        m.counter('meshtastic_bridge_duplicates_total', "Rebroadcasts and cross-radio copies dropped",
+                  collect=lambda: [((), self.dedupe.total_duplicates)])
+        self.reconnects_metric = m.counter('meshtastic_bridge_reconnects_total', "Recoveries started", ('radio',))
+        self.reconnect_duration = m.histogram('meshtastic_bridge_reconnect_duration_seconds',
+                                              "Time from losing a radio to reopening it", ('radio',),
+                                              buckets=RECONNECT_BUCKETS)
+        m.gauge('meshtastic_bridge_radio_connected', "1 while the radio's interface is open", ('radio',),
+                collect=lambda: [((radio.name,), int(radio.interface is not None)) for radio in self.radios])
+        m.gauge('meshtastic_bridge_nodes', "Nodes in the node table",
+                collect=lambda: [((), len(self.nodes.records))])
+        m.gauge('meshtastic_bridge_uptime_seconds', "Seconds since the bridge started",
+                collect=lambda: [((), time.time() - self.start_time)] if hasattr(self, 'start_time') else [])
+        m.gauge('meshtastic_bridge_stage_latency_seconds',
+                "Packet latency percentiles per stage over the last LATENCY_WINDOW packets", ('stage', 'quantile'),
+                collect=self.tracer.collect)
+        self.node_rssi = m.gauge('meshtastic_node_rssi_dbm', "RSSI of the last packet heard from a node", ('node_id',))
+        self.node_snr = m.gauge('meshtastic_node_snr_db', "SNR of the last packet heard from a node", ('node_id',))
+        self.node_signal_heard = OrderedDict()  # node_id -> monotonic time, least recently heard first
+        self.node_signal_lock = threading.Lock()
+    
+    def record_node_signal(self, node_id, rssi, snr):
+        """Update a node's RSSI/SNR gauges and note when it was heard"""
+        with self.node_signal_lock:
+            self.node_rssi.set(rssi, node_id)
+            self.node_snr.set(snr, node_id)
+            self.node_signal_heard[node_id] = time.monotonic()
+            self.node_signal_heard.move_to_end(node_id)
+    
+    def expire_node_signals(self, ttl=NODE_METRICS_TTL):
+        """Remove the RSSI/SNR series of nodes not heard within ttl seconds"""
+        cutoff = time.monotonic() - ttl
+        with self.node_signal_lock:
+            while self.node_signal_heard:
+                node_id, heard = next(iter(self.node_signal_heard.items()))
+                if heard >= cutoff:
+                    break
+                del self.node_signal_heard[node_id]
+                self.node_rssi.remove(node_id)
+                self.node_snr.remove(node_id)
+    
+    def collect_queue_depths(self):
+        publisher = self.publisher.stats()
+        depths = [
+            (('ingest',), self.ingest.stats()['depth']),
+            (('publish',), publisher['queued']),
+            (('publish_latest',), publisher['pending_latest']),
+        ]
+        if self.history:
+            depths.append((('history',), self.history.stats()['queued']))
+        if self.capture:
+            depths.append((('capture',), self.capture.stats()['queued']))
+        return depths
+    
+    def start_metrics(self):
+        """Start the metrics endpoint; a busy port is logged, not fatal"""
+        if not METRICS_PORT:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, METRICS_PORT, METRICS_BIND)
+            self.metrics_server.start()
+        except OSError as e:
+            logger.error(f"Failed to start metrics endpoint on port {METRICS_PORT}: {e}")
+            self.metrics_server = None
+    
     def signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         logger.info(f"Received signal {signum}, shutting down gracefully...")
         self.running = False
-        if self.heartbeat_thread:
-            self.heartbeat_thread.join(timeout=5)
+        for radio in self.radios:
+            if radio.heartbeat_thread:
+                radio.heartbeat_thread.join(timeout=5)
         self.cleanup()
         sys.exit(0)
         
@@ -99,8 +2481,9 @@ class MeshtasticBridge:
             self.mqtt_client = mqtt.Client(client_id="meshtastic_bridge", callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
             self.mqtt_client.on_connect = self.on_mqtt_connect
             self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
+            self.mqtt_client.on_publish = self.on_mqtt_publish
+            self.mqtt_client.on_message = self.on_mqtt_message
+            self.start_mqtt_client()
             logger.info("MQTT client connected")
             return True
         except Exception as e:
@@ -110,18 +2493,30 @@ class MeshtasticBridge:
                 self.mqtt_client = mqtt.Client(client_id="meshtastic_bridge")
                 self.mqtt_client.on_connect = self.on_mqtt_connect_legacy
                 self.mqtt_client.on_disconnect = self.on_mqtt_disconnect_legacy
-                self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-                self.mqtt_client.loop_start()
+                self.mqtt_client.on_publish = self.on_mqtt_publish
+                self.mqtt_client.on_message = self.on_mqtt_message
+                self.start_mqtt_client()
                 logger.info("MQTT client connected (legacy API)")
                 return True
             except Exception as e2:
                 logger.error(f"Failed to connect to MQTT broker: {e2}")
                 return False
+    
+    def start_mqtt_client(self):
+        """Connect and start network I/O: paho's thread, or the event loop in asyncio mode"""
+        if self.loop:
+            self.mqtt_io = AsyncioMQTT(self.loop, self.mqtt_client)
+            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        else:
+            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            self.mqtt_client.loop_start()
+        self.publisher.start(self.loop)
             
     def on_mqtt_connect(self, client, userdata, flags, reason_code, properties=None):
         """MQTT connection callback (new API)"""
         if reason_code == 0:
             logger.info("Connected to MQTT broker")
+            client.subscribe(DASHBOARD_METRICS_TOPIC)
             self.publish_status("bridge_status", "connected")
         else:
             logger.error(f"Failed to connect to MQTT broker with code {reason_code}")
@@ -131,10 +2526,29 @@ class MeshtasticBridge:
         logger.warning(f"Disconnected from MQTT broker with code {reason_code}")
         self.publish_status("bridge_status", "mqtt_disconnected")
         
+    def on_mqtt_publish(self, client, userdata, mid, *args):
+        """Publish callback (both APIs): completes the latency trace for mid, if any"""
+        self.tracer.acked(mid)
+    
+    def on_mqtt_message(self, client, userdata, msg):
+        """Render and delivery timings reported by dashboards"""
+        if msg.topic != DASHBOARD_METRICS_TOPIC:
+            return
+        try:
+            report = json.loads(msg.payload)
+            for stage, key in (('render', 'render_ms'), ('delivery', 'delivery_ms')):
+                values = [float(value) / 1000 for value in report.get(key, [])[:500]
+                          if isinstance(value, (int, float)) and value >= 0]
+                if values:
+                    self.tracer.add_samples(stage, values)
+        except Exception as e:
+            logger.debug(f"Ignoring malformed dashboard metrics: {e}")
+    
     def on_mqtt_connect_legacy(self, client, userdata, flags, rc):
         """MQTT connection callback (legacy API)"""
         if rc == 0:
             logger.info("Connected to MQTT broker")
+            client.subscribe(DASHBOARD_METRICS_TOPIC)
             self.publish_status("bridge_status", "connected")
         else:
             logger.error(f"Failed to connect to MQTT broker with code {rc}")
@@ -144,93 +2558,84 @@ class MeshtasticBridge:
         logger.warning(f"Disconnected from MQTT broker with code {rc}")
         self.publish_status("bridge_status", "mqtt_disconnected")
     
-    def setup_meshtastic(self):
-        """Initialize Meshtastic interface with enhanced error handling"""
+    def handed_off(self, callback, *args):
+        """In asyncio mode, re-run a callback from a foreign thread on the event loop
+
+        Returns True if the call was handed off and the caller should return.
+        """
+        if self.loop is None or threading.get_ident() == self.loop_thread:
+            return False
+        self.loop.call_soon_threadsafe(callback, *args)
+        return True
+    
+    def setup_meshtastic(self, radio):
+        """Initialize a radio's Meshtastic interface with enhanced error handling"""
         try:
-            logger.info(f"🔌 Connecting to Meshtastic device on {SERIAL_PORT}")
+            logger.info(f"🔌 Connecting to Meshtastic device on {radio.port}")
+            
+            # Subscribe to message events (only the first call subscribes)
+            self.subscriptions.subscribe()
             
-            # Close existing connection if any
-            if self.meshtastic_interface:
+            # Close existing connection if any; its reader thread may still deliver, which the new generation drops
+            if radio.interface:
                 try:
-                    self.meshtastic_interface.close()
+                    radio.interface.close()
                 except:
                     pass
-                self.meshtastic_interface = None
+                radio.interface = None
+            generation = self.subscriptions.open(radio)
             
             # Create new connection with timeout
-            self.meshtastic_interface = meshtastic.serial_interface.SerialInterface(
-                SERIAL_PORT,
-                debugOut=None,  # Disable debug output for cleaner logs
-                connectNow=True
-            )
+            radio.interface = self.interface_layer.open(radio.port)
+            self.subscriptions.attach(generation, radio.interface)
+            logger.info(f"Interface generation {generation.number} bound to {radio.port}")
             
             # Give it time to initialize
             time.sleep(2)
             
-            # Subscribe to message events
-            pub.subscribe(self.on_receive, "meshtastic.receive")
-            pub.subscribe(self.on_connection, "meshtastic.connection.established")
-            pub.subscribe(self.on_node_updated, "meshtastic.node.updated")
-            
             # Test the connection and get initial node list
-            if self.test_connection():
-                logger.info(f"✅ Meshtastic interface connected successfully")
+            if self.test_connection(radio):
+                logger.info(f"✅ Meshtastic interface on {radio.port} connected successfully")
                 
                 # Try to get initial node information
-                self.refresh_node_database()
+                self.refresh_node_database(radio)
                 
-                self.last_packet_time = time.time()
-                self.reconnect_attempts = 0
-                self.publish_status("meshtastic_status", "connected")
+                radio.last_packet_time = time.time()
+                self.publish_status("meshtastic_status", "connected", radio)
                 return True
             else:
-                logger.error("❌ Meshtastic connection test failed")
+                logger.error(f"❌ Meshtastic connection test failed on {radio.port}")
                 return False
                 
         except Exception as e:
-            logger.error(f"❌ Failed to connect to Meshtastic device: {e}")
-            self.publish_status("meshtastic_status", f"error: {str(e)}")
+            logger.error(f"❌ Failed to connect to Meshtastic device on {radio.port}: {e}")
+            self.subscriptions.retire(radio)
+            self.publish_status("meshtastic_status", f"error: {str(e)}", radio)
             return False
     
-    def reconnect_meshtastic(self):
-        """Reconnect to Meshtastic device with enhanced recovery"""
-        self.reconnect_attempts += 1
-        logger.info(f"🔄 Reconnecting to Meshtastic (attempt {self.reconnect_attempts})...")
-        
-        if self.reconnect_attempts <= MAX_RECONNECT_ATTEMPTS:
-            # Try normal reconnection first
-            if self.setup_meshtastic():
-                logger.info("✅ Reconnection successful")
-                return True
-            else:
-                logger.warning(f"❌ Reconnection attempt {self.reconnect_attempts} failed")
-                time.sleep(RECONNECT_DELAY)
+    def reconnect_meshtastic(self, radio, reason="connection unhealthy"):
+        """Start timer-driven recovery of a radio; returns without waiting for it"""
+        if radio.recovery.trigger(reason):
+            logger.info(f"🔄 Reconnecting to Meshtastic on {radio.port} ({reason})...")
         else:
-            # After max attempts, try advanced recovery
-            logger.info(f"🔧 Attempting advanced recovery after {MAX_RECONNECT_ATTEMPTS} failed attempts...")
-            if self.advanced_reconnect_sequence():
-                logger.info("✅ Advanced recovery successful")
-                return True
-            else:
-                logger.error("❌ Advanced recovery failed, waiting longer before retry...")
-                self.reconnect_attempts = 0  # Reset counter
-                time.sleep(60)  # Wait 1 minute before trying again
-        
-        return False
+            logger.debug(f"Recovery already in progress on {radio.port}")
     
-    def refresh_node_database(self):
-        """Get current node information from the interface"""
+    def refresh_node_database(self, radio):
+        """Get current node information from a radio's interface"""
         try:
-            if self.meshtastic_interface and hasattr(self.meshtastic_interface, 'nodes'):
-                nodes = self.meshtastic_interface.nodes
+            if radio.interface and hasattr(radio.interface, 'nodes'):
+                nodes = radio.interface.nodes
                 logger.info(f"📋 Refreshing node database with {len(nodes)} nodes")
                 
-                for node_num, node in nodes.items():
-                    # node_num might already be a string or an int, handle both cases
-                    if isinstance(node_num, str):
-                        node_id = node_num if node_num.startswith('!') else f"!{node_num}"
+                for node_key, node in nodes.items():
+                    # Keys are usually '!xxxxxxxx' IDs but may be node numbers; prefer the record's own num
+                    if 'num' in node:
+                        node_num = node['num']
+                    elif isinstance(node_key, str):
+                        node_num = node_num_from_id(node_key)
                     else:
-                        node_id = f"!{node_num:08x}"
+                        node_num = node_key
+                    node_id = node_id_from_num(node_num)
                     
                     user_info = node.get('user', {})
                     
@@ -239,56 +2644,91 @@ class MeshtasticBridge:
                         long_name = user_info.get('longName', 'Unknown')
                         hw_model = user_info.get('hwModel', 'Unknown')
                         
-                        self.update_node_name(node_id, short_name, long_name, hw_model)
+                        self.update_node_name(node_num, short_name, long_name, hw_model)
                         
                         logger.info(f"   📱 {short_name} ({node_id}) - {hw_model}")
         except Exception as e:
             logger.error(f"Error refreshing node database: {e}")
     
-    def test_connection(self):
-        """Test if the Meshtastic connection is working"""
+    def test_connection(self, radio):
+        """Test if a radio's Meshtastic connection is working"""
         try:
-            if self.meshtastic_interface and hasattr(self.meshtastic_interface, 'nodes'):
+            if radio.interface and hasattr(radio.interface, 'nodes'):
                 # Try to access node information as a connection test
-                nodes = self.meshtastic_interface.nodes
+                nodes = radio.interface.nodes
                 logger.info(f"Connection test passed - found {len(nodes)} nodes")
                 return True
         except Exception as e:
             logger.error(f"Connection test failed: {e}")
         return False
     
-    def check_connection_health(self):
-        """Check if we're still receiving packets"""
+    def check_connection_health(self, radio):
+        """Check if a radio is still receiving packets"""
         current_time = time.time()
-        time_since_last_packet = current_time - self.last_packet_time
+        time_since_last_packet = current_time - radio.last_packet_time
         
         if time_since_last_packet > CONNECTION_TIMEOUT:
-            logger.warning(f"No packets received for {time_since_last_packet:.1f} seconds, connection may be dead")
-            self.publish_status("connection_health", f"stale_{int(time_since_last_packet)}s")
+            logger.warning(f"No packets received on {radio.port} for {time_since_last_packet:.1f} seconds, connection may be dead")
+            self.publish_status("connection_health", f"stale_{int(time_since_last_packet)}s", radio)
             return False
         else:
-            logger.debug(f"Connection healthy - last packet {time_since_last_packet:.1f}s ago")
-            self.publish_status("connection_health", "healthy")
+            logger.debug(f"Connection on {radio.port} healthy - last packet {time_since_last_packet:.1f}s ago")
+            self.publish_status("connection_health", "healthy", radio)
             return True
     
-    def heartbeat_monitor(self):
-        """Background thread to monitor connection health"""
-        logger.info("Starting connection monitor thread")
+    def heartbeat_monitor(self, radio):
+        """Background thread to monitor one radio's connection health"""
+        logger.info(f"Starting connection monitor thread for {radio.port}")
         while self.running:
             try:
                 time.sleep(HEARTBEAT_INTERVAL)
                 if not self.running:
                     break
                     
-                if not self.check_connection_health():
-                    logger.warning("Connection appears unhealthy, attempting reconnection")
-                    self.reconnect_meshtastic()
+                if not self.check_connection_health(radio):
+                    self.reconnect_meshtastic(radio)
                     
             except Exception as e:
                 logger.error(f"Error in heartbeat monitor: {e}")
     
-    def reset_usb_driver(self):
-        """Reset the CP210x USB driver module"""
+    def probe_radio(self, radio):
+        """Check whether a radio's serial device exists, following it to a new port by VID/PID"""
+        if self.interface_layer.exists(radio.port):
+            return True
+        logger.warning(f"⚠️ Device {radio.port} not found")
+        # Radios probe from their own timers; claim a port atomically so two
+        # missing radios can't both take the same new device. Another
+        # radio's port is taken even while its own reopen is still trying it.
+        with self.port_lock:
+            taken = {other.port for other in self.radios if other is not radio}
+            for port in self.interface_layer.discover():
+                if port not in taken:
+                    logger.info(f"📍 Found radio for {radio.name} on {port} (was {radio.port})")
+                    radio.port = port
+                    return True
+        self.list_available_ports(radio)
+        return False
+    
+    def report_reconnect_state(self, status_type, info, radio):
+        """Record a reconnect transition in the metrics, then publish it as a status"""
+        if info['previous'] == ReconnectMachine.IDLE:
+            self.reconnects_metric.inc(radio.name)
+        if 'recovery_seconds' in info:
+            self.reconnect_duration.observe(info['recovery_seconds'], radio.name)
+        self.publish_status(status_type, info, radio)
+    
+    def on_hotplug(self, action, path):
+        """React to a tty appearing or disappearing without waiting for the heartbeat"""
+        logger.info(f"🔌 Hotplug: {action} {path}")
+        for radio in self.radios:
+            if action == 'remove':
+                if radio.port == path:
+                    self.reconnect_meshtastic(radio, "device removed")
+            elif radio.port == path or not os.path.exists(radio.port) or radio.interface is None:
+                radio.recovery.device_appeared()
+    
+    def unload_usb_driver(self):
+        """Remove the CP210x USB driver module (first half of a driver reset)"""
         try:
             logger.info("🔧 Attempting to reset CP210x USB driver...")
             
@@ -304,35 +2744,25 @@ class MeshtasticBridge:
             if result != 0:
                 logger.error("Failed to remove cp210x module")
                 return False
-            
-            # Wait a moment for cleanup
-            time.sleep(2)
-            
-            # Reload the module
+            return True
+        except Exception as e:
+            logger.error(f"Error resetting USB driver: {e}")
+            return False
+    
+    def load_usb_driver(self):
+        """Reload the CP210x USB driver module"""
+        try:
             logger.info("   Reloading cp210x module...")
             result = os.system("sudo modprobe cp210x")
             if result != 0:
                 logger.error("Failed to reload cp210x module")
                 return False
-            
-            # Wait for device enumeration
-            time.sleep(3)
-            
-            # Check if our serial port is back
-            if os.path.exists(SERIAL_PORT):
-                logger.info("✅ CP210x driver reset successful - device detected")
-                return True
-            else:
-                logger.warning(f"⚠️ CP210x driver reset completed but {SERIAL_PORT} not found")
-                # List available serial ports for debugging
-                self.list_available_ports()
-                return False
-                
+            return True
         except Exception as e:
             logger.error(f"Error resetting USB driver: {e}")
             return False
     
-    def list_available_ports(self):
+    def list_available_ports(self, radio):
         """List available serial ports for debugging"""
         try:
             logger.info("🔍 Scanning for available serial ports...")
@@ -349,90 +2779,53 @@ class MeshtasticBridge:
                 logger.info(f"   Found ports: {', '.join(found_ports)}")
                 
                 # If we find a port and our configured port doesn't exist, suggest update
-                if not os.path.exists(SERIAL_PORT) and found_ports:
-                    logger.info(f"   💡 Consider updating SERIAL_PORT from {SERIAL_PORT} to {found_ports[0]}")
+                if not os.path.exists(radio.port) and found_ports:
+                    logger.info(f"   💡 Consider updating SERIAL_PORTS from {radio.port} to {found_ports[0]}")
             else:
                 logger.warning("   No serial ports found")
                 
         except Exception as e:
             logger.error(f"Error listing serial ports: {e}")
     
-    def advanced_reconnect_sequence(self):
-        """Advanced reconnection with driver reset"""
-        logger.info("🔄 Starting advanced reconnection sequence...")
-        
-        # Step 1: Try normal reconnection first
-        logger.info("Step 1: Attempting normal reconnection...")
-        if self.setup_meshtastic():
-            logger.info("✅ Normal reconnection successful")
-            return True
-        
-        # Step 2: Check if device exists
-        logger.info("Step 2: Checking device availability...")
-        if not os.path.exists(SERIAL_PORT):
-            logger.warning(f"⚠️ Device {SERIAL_PORT} not found")
-            self.list_available_ports()
-            
-            # Step 3: Reset USB driver
-            logger.info("Step 3: Resetting USB driver...")
-            if self.reset_usb_driver():
-                # Step 4: Try reconnection after driver reset
-                logger.info("Step 4: Attempting reconnection after driver reset...")
-                time.sleep(2)  # Give device time to settle
-                if self.setup_meshtastic():
-                    logger.info("✅ Reconnection successful after driver reset")
-                    return True
-            else:
-                logger.error("❌ Driver reset failed")
-        else:
-            logger.info("✅ Device exists, trying alternative approaches...")
-            
-            # Step 3: Reset USB driver anyway (might be in bad state)
-            logger.info("Step 3: Resetting USB driver (device in bad state)...")
-            if self.reset_usb_driver():
-                logger.info("Step 4: Attempting reconnection after driver reset...")
-                time.sleep(2)
-                if self.setup_meshtastic():
-                    logger.info("✅ Reconnection successful after driver reset")
-                    return True
-        
-        logger.error("❌ Advanced reconnection sequence failed")
-        return False
-    
-    def on_connection(self, interface, topic=pub.AUTO_TOPIC):
+    def on_connection(self, radio):
         """Handle Meshtastic connection events"""
+        if self.handed_off(self.on_connection, radio):
+            return
         logger.info("Meshtastic connection established event received")
-        self.publish_status("connection_event", "established")
-        self.last_packet_time = time.time()
+        self.publish_status("connection_event", "established", radio)
+        if radio:
+            radio.last_packet_time = time.time()
         
-    def on_node_updated(self, interface, node, topic=pub.AUTO_TOPIC):
+    def on_node_updated(self, node, radio=None):
         """Handle node information updates"""
+        if self.handed_off(self.on_node_updated, node, radio):
+            return
         try:
-            self.last_packet_time = time.time()  # Update last activity time
+            if radio:
+                radio.last_packet_time = time.time()  # Update last activity time
             
-            node_id = f"!{node['num']:08x}"
+            node_num = node['num']
+            node_id = node_id_from_num(node_num)
             user_info = node.get('user', {})
+            metrics = node.get('deviceMetrics', {})
             
             # Extract user information with emoji support
             short_name = user_info.get('shortName', 'UNK')
             long_name = user_info.get('longName', 'Unknown')
             hw_model = user_info.get('hwModel', 'Unknown')
             
-            node_data = {
-                'node_id': node_id,
-                'short_name': short_name,
-                'long_name': long_name,
-                'hw_model': hw_model,
-                'last_heard': node.get('lastHeard', 0),
-                'snr': node.get('snr', 0),
-                'battery_level': node.get('deviceMetrics', {}).get('batteryLevel', 0),
-                'voltage': node.get('deviceMetrics', {}).get('voltage', 0.0),
-                'channel_utilization': node.get('deviceMetrics', {}).get('channelUtilization', 0.0),
-                'air_util_tx': node.get('deviceMetrics', {}).get('airUtilTx', 0.0)
-            }
-            
-            self.node_info[node_id] = node_data
-            self.publish_node_info(node_data)
+            with self.state_lock:
+                record = self.nodes.get_or_create(node_num)
+                self.nodes.set_short_name(record, short_name)
+                record.long_name = long_name
+                record.hw_model = hw_model
+                record.last_heard = node.get('lastHeard', 0)
+                record.snr = node.get('snr', 0)
+                record.battery_level = metrics.get('batteryLevel', 0)
+                record.voltage = metrics.get('voltage', 0.0)
+                record.channel_utilization = metrics.get('channelUtilization', 0.0)
+                record.air_util_tx = metrics.get('airUtilTx', 0.0)
+                self.publish_node_info(record)
             
             # Use emoji in logging for better visibility
             display_name = short_name if short_name != 'UNK' else long_name
@@ -441,23 +2834,123 @@ class MeshtasticBridge:
         except Exception as e:
             logger.error(f"Error processing node update: {e}")
     
-    def on_receive(self, packet, interface=None):
-        """Handle received Meshtastic packets"""
+    def on_receive(self, packet, radio=None, trace=None):
+        """Handle received Meshtastic packets on the reader thread
+
+        Only records activity (and the raw packet, when capturing), drops
+        copies already heard by another radio and enqueues the raw packet;
+        decoding and publishing happen on the ingest workers. In asyncio
+        mode the whole callback moves to the loop.
+        Called by the SubscriptionManager with the radio the packet came from.
+        """
+        if trace is None:
+            trace = self.tracer.start(packet.get('rxTime'))
+        if self.handed_off(self.on_receive, packet, radio, trace):
+            return
+        if self.capture:
+            self.capture.add(packet, radio.name if radio else None)
+        if radio:
+            radio.last_packet_time = time.time()  # Update last activity time
+            radio.packets += 1
+        if not self.dedupe.observe(packet, radio.name if radio else None):
+            if radio:
+                radio.duplicates += 1
+            return
+        self.ingest.put(packet, radio.name if radio else None, trace)
+        if self.loop:
+            self.ingest_ready.set()
+    
+    def ingest_worker(self):
+        """Worker thread: decode queued packets and publish them"""
+        while True:
+            item = self.ingest.get()
+            if item is None:
+                return
+            self.process_packet(*item)
+    
+    def start_workers(self):
+        """Start the ingest worker pool"""
+        for index in range(INGEST_WORKERS):
+            worker = threading.Thread(target=self.ingest_worker, name=f"ingest-{index}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+    
+    def stop_workers(self, timeout=INGEST_DRAIN_TIMEOUT):
+        """Close the ingest queue and let the workers finish what was already accepted
+
+        In asyncio mode the ingest task is already cancelled, so the rest of
+        the queue is processed here. Whatever is left at the deadline is
+        dropped.
+        """
+        self.ingest.close()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        while time.monotonic() < deadline:
+            item = self.ingest.get_nowait()
+            if item is None:
+                break
+            self.process_packet(*item)
+        dropped = self.ingest.discard()
+        if dropped:
+            logger.warning(f"Dropped {dropped} queued packets on shutdown")
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        if self.workers:
+            logger.warning(f"{len(self.workers)} ingest workers still busy after {timeout}s")
+    
+    def process_packet(self, packet, radio_name=None, trace=None):
+        """Decode a raw packet and publish it to MQTT"""
+        started = time.monotonic()
+        packet_data = self.decode_packet(packet, radio_name)
+        decoded = time.monotonic()
+        self.decode_latency.observe(decoded - started)
+        if trace is not None:
+            trace.decode_started = started
+            trace.decoded = decoded
+        if packet_data is not None:
+            self.packets_metric.inc(packet_data.get('message_type', 'unknown'), packet_data.get('port_num', 'unknown'))
+            if packet_data.get('rssi'):
+                self.record_node_signal(packet_data['from_id'], packet_data['rssi'], packet_data.get('snr', 0))
+            # Encode once, outside the lock; every sink shares the result
+            try:
+                message = PreparedMessage(packet_data)
+            except Exception as e:
+                logger.error(f"Error encoding packet: {e}")
+                return
+            if trace is not None:
+                trace.encoded = time.monotonic()
+            self.publish_packet(message, trace)
+            self.recent.add(message)
+            self.rolling_stats.add(packet_data)
+            if self.history:
+                self.history.add_packet(message)
+    
+    def decode_packet(self, packet, radio_name=None):
+        """Turn a raw Meshtastic packet into packet_data, updating node state
+
+        Only the reads and writes of shared node state take state_lock, so
+        workers decode packets in parallel.
+        """
         try:
-            self.last_packet_time = time.time()  # Update last activity time
-            self.message_count += 1
-            
             # Extract basic packet info
-            from_id = f"!{packet['from']:08x}"
-            to_id = f"!{packet['to']:08x}"
+            from_num = packet['from']
+            to_num = packet['to']
+            from_id = node_id_from_num(from_num)
+            to_id = node_id_from_num(to_num)
+            
+            with self.state_lock:
+                self.message_count += 1
+                message_count = self.message_count
+                from_name = self.get_node_name(from_num)
+                to_name = self.get_node_name(to_num)
             
             packet_data = {
                 'timestamp': datetime.now().isoformat(),
-                'message_count': self.message_count,
+                'message_count': message_count,
                 'from_id': from_id,
                 'to_id': to_id,
-                'from_name': self.get_node_name(from_id),
-                'to_name': self.get_node_name(to_id),
+                'from_name': from_name,
+                'to_name': to_name,
                 'hop_limit': packet.get('hopLimit', 0),
                 'hop_start': packet.get('hopStart', 0),
                 'want_ack': packet.get('wantAck', False),
@@ -467,6 +2960,10 @@ class MeshtasticBridge:
                 'snr': packet.get('rxSnr', 0.0),
                 'rx_time': packet.get('rxTime', 0)
             }
+            if packet.get('id'):
+                packet_data['packet_id'] = packet['id']
+            if radio_name:
+                packet_data['radio'] = radio_name  # Which of our radios heard it
             
             # Process different packet types
             if 'decoded' in packet:
@@ -492,10 +2989,11 @@ class MeshtasticBridge:
                         long_name = user_info_safe.get('longName', '')
                         hw_model = user_info_safe.get('hwModel', '')
                         
-                        self.update_node_name(from_id, short_name, long_name, hw_model)
+                        self.update_node_name(from_num, short_name, long_name, hw_model)
                         
                         # Update packet data with the new name
-                        packet_data['from_name'] = self.get_node_name(from_id)
+                        with self.state_lock:
+                            packet_data['from_name'] = self.get_node_name(from_num)
                         
                     logger.info(f"ℹ️ Node info from {packet_data['from_name']}")
                     
@@ -522,11 +3020,14 @@ class MeshtasticBridge:
                             packet_data['air_util_tx'] = metrics.get('airUtilTx', 0.0)
                             
                             # Update our node info with telemetry data
-                            if from_id in self.node_info:
-                                self.node_info[from_id]['battery_level'] = packet_data['battery_level']
-                                self.node_info[from_id]['voltage'] = packet_data['voltage']
-                                self.node_info[from_id]['channel_utilization'] = packet_data['channel_utilization']
-                                self.node_info[from_id]['air_util_tx'] = packet_data['air_util_tx']
+                            with self.state_lock:
+                                record = self.nodes.get(from_num)
+                                if record is not None:
+                                    record.battery_level = packet_data['battery_level']
+                                    record.voltage = packet_data['voltage']
+                                    record.channel_utilization = packet_data['channel_utilization']
+                                    record.air_util_tx = packet_data['air_util_tx']
+                                    self.node_summary.update(from_num)
                     
                     logger.debug(f"📊 Telemetry from {packet_data['from_name']}")
                     
@@ -535,17 +3036,18 @@ class MeshtasticBridge:
                     packet_data['port_num'] = str(decoded.get('portnum', 'UNKNOWN'))
                     logger.debug(f"📦 Other packet from {packet_data['from_name']}: {packet_data['port_num']}")
             
-            # Publish to MQTT using safe conversion
-            self.publish_packet(packet_data)
+            return packet_data
             
         except Exception as e:
             logger.error(f"Error processing received packet: {e}")
+            return None
     
-    def get_node_name(self, node_id):
-        """Get friendly name for a node ID with emoji support"""
-        if node_id in self.node_info:
-            short_name = self.node_info[node_id].get('short_name', '')
-            long_name = self.node_info[node_id].get('long_name', '')
+    def get_node_name(self, node_num):
+        """Get friendly name for a node number with emoji support"""
+        record = self.nodes.get(node_num)
+        if record is not None:
+            short_name = record.short_name
+            long_name = record.long_name
             
             # Prefer short name, fallback to long name, then node_id
             if short_name and short_name != 'UNK':
@@ -553,10 +3055,10 @@ class MeshtasticBridge:
             elif long_name and long_name != 'Unknown':
                 return long_name
             else:
-                return node_id
+                return record.node_id
         
         # For unknown nodes, try to make a friendlier display
-        return self.make_friendly_node_id(node_id)
+        return self.make_friendly_node_id(node_id_from_num(node_num))
     
     def make_friendly_node_id(self, node_id):
         """Convert hex node ID to a more friendly format"""
@@ -566,118 +3068,266 @@ class MeshtasticBridge:
             return f"Node-{short_hex}"
         return node_id
     
-    def update_node_name(self, node_id, short_name=None, long_name=None, hw_model=None):
+    def update_node_name(self, node_num, short_name=None, long_name=None, hw_model=None):
         """Update node information when we learn more about it"""
-        if node_id not in self.node_info:
-            self.node_info[node_id] = {
-                'node_id': node_id,
-                'short_name': 'UNK',
-                'long_name': 'Unknown',
-                'hw_model': 'Unknown',
-                'last_heard': 0,
-                'snr': 0,
-                'battery_level': 0,
-                'voltage': 0.0,
-                'channel_utilization': 0.0,
-                'air_util_tx': 0.0
-            }
-        
-        # Update with new information
-        node_data = self.node_info[node_id]
-        if short_name:
-            node_data['short_name'] = str(short_name)  # Ensure it's a string
-        if long_name:
-            node_data['long_name'] = str(long_name)   # Ensure it's a string
-        if hw_model:
-            node_data['hw_model'] = str(hw_model)     # Ensure it's a string
-        
-        node_data['last_heard'] = int(time.time())
-        
-        # Publish updated node info
-        self.publish_node_info(node_data)
+        with self.state_lock:
+            record = self.nodes.get_or_create(node_num)
+            
+            # Update with new information
+            if short_name:
+                self.nodes.set_short_name(record, str(short_name))  # Ensure it's a string
+            if long_name:
+                record.long_name = str(long_name)   # Ensure it's a string
+            if hw_model:
+                record.hw_model = str(hw_model)     # Ensure it's a string
+            
+            record.last_heard = int(time.time())
+            
+            # Publish updated node info
+            self.publish_node_info(record)
         
-        logger.info(f"Updated node {node_id}: short='{short_name}', long='{long_name}', hw='{hw_model}'")
+            logger.info(f"Updated node {record.node_id}: short='{short_name}', long='{long_name}', hw='{hw_model}'")
     
-    def publish_packet(self, packet_data):
-        """Publish packet data to MQTT with proper JSON serialization"""
+    def publish_packet(self, message, trace=None):
+        """Publish a prepared packet to every topic it fans out to; the first publish carries the trace"""
         try:
             if not self.mqtt_client:
                 return
             
-            # Use safe_json_convert to ensure everything is JSON serializable
-            clean_packet = safe_json_convert(packet_data)
-                
-            topic = f"{MQTT_TOPIC_PREFIX}/packets"
-            payload = json.dumps(clean_packet, ensure_ascii=False)
-            self.mqtt_client.publish(topic, payload)
-            
-            # Also publish by message type
-            msg_type = clean_packet.get('message_type', 'unknown')
-            type_topic = f"{MQTT_TOPIC_PREFIX}/packets/{msg_type}"
-            self.mqtt_client.publish(type_topic, payload)
+            telemetry = message.data.get('message_type') == 'telemetry'
+            for topic, payload in message.fan_out():
+                self.publisher.submit(topic, payload, trace=trace, telemetry=telemetry)
+                trace = None
             
         except Exception as e:
             logger.error(f"Error publishing packet to MQTT: {e}")
             # Log the problematic packet for debugging
-            logger.debug(f"Problematic packet keys: {list(packet_data.keys())}")
-            for key, value in packet_data.items():
+            logger.debug(f"Problematic packet keys: {list(message.data.keys())}")
+            for key, value in message.data.items():
                 logger.debug(f"  {key}: {type(value)} = {value}")
     
-    def publish_node_info(self, node_data):
-        """Publish node information to MQTT with proper JSON serialization"""
+    def encode_node_info(self, node_num):
+        """Serialize a single node record, or None if the node is unknown"""
+        with self.state_lock:
+            record = self.nodes.get(node_num)
+            if record is None:
+                return None
+            return NODE_ENCODER.encode(record.to_dict())
+    
+    def publish_node_info(self, record):
+        """Publish a node record to MQTT with proper JSON serialization"""
         try:
             if not self.mqtt_client:
                 return
             
-            # Use safe_json_convert to ensure everything is JSON serializable
-            clean_node_data = safe_json_convert(node_data)
+            # The encoder falls back to safe_json_convert for anything unexpected
+            payload = NODE_ENCODER.encode(record.to_dict())
                 
-            topic = f"{MQTT_TOPIC_PREFIX}/nodes/{clean_node_data['node_id']}"
-            payload = json.dumps(clean_node_data, ensure_ascii=False)
-            self.mqtt_client.publish(topic, payload, retain=True)
-            
-            # Publish summary of all nodes
-            nodes_summary = {
-                'total_nodes': len(self.node_info),
-                'nodes': []
-            }
-            
-            # Clean node info for summary using safe_json_convert
-            for node_data in self.node_info.values():
-                clean_node = safe_json_convert(node_data)
-                nodes_summary['nodes'].append(clean_node)
+            topic = f"{MQTT_TOPIC_PREFIX}/nodes/{record.node_id}"
+            self.publisher.submit(topic, payload, retain=True)
             
-            nodes_summary['updated'] = datetime.now().isoformat()
-            
-            summary_topic = f"{MQTT_TOPIC_PREFIX}/nodes_summary"
-            self.mqtt_client.publish(summary_topic, json.dumps(nodes_summary, ensure_ascii=False))
+            # The node payload doubles as its nodes_summary fragment
+            self.node_summary.update(record.num, payload)
+            if self.history:
+                self.history.add_node(record, payload)
             
         except Exception as e:
             logger.error(f"Error publishing node info to MQTT: {e}")
     
-    def publish_status(self, status_type, value):
+    def publish_nodes_summary(self, payload):
+        """Publish the coalesced summary of all nodes"""
+        if not self.mqtt_client:
+            return
+        summary_topic = f"{MQTT_TOPIC_PREFIX}/nodes_summary"
+        self.publisher.submit(summary_topic, payload, coalesce=True)
+    
+    def publish_duplicates(self):
+        """Publish one summary of the dedupe windows that closed since the last call
+
+        The summary coalesces (latest wins) rather than queueing behind packets,
+        however many packets were rebroadcast.
+        """
+        try:
+            if not self.mqtt_client:
+                return
+            entries = [entry.to_dict() for entry in self.dedupe.expire()]
+            if not entries:
+                return
+            payload = json.dumps({
+                'timestamp': datetime.now().isoformat(),
+                'packets': len(entries),
+                'duplicates': sum(entry['duplicates'] for entry in entries),
+                'entries': entries,
+            }, ensure_ascii=False)
+            self.publisher.submit(f"{MQTT_TOPIC_PREFIX}/duplicates", payload, coalesce=True)
+        except Exception as e:
+            logger.error(f"Error publishing duplicate summary: {e}")
+    
+    def publish_latency(self):
+        """Retained per-stage latency percentiles, for dashboards and ad-hoc checks"""
+        stages = self.tracer.summary()
+        if not stages or not self.mqtt_client:
+            return
+        payload = json.dumps({'timestamp': datetime.now().isoformat(), 'stages': stages})
+        self.publisher.submit(f"{MQTT_TOPIC_PREFIX}/latency", payload, retain=True)
+    
+    def publish_stats(self):
+        """Retained rolling aggregates, so dashboards don't rebuild them from raw packets"""
+        if not self.mqtt_client:
+            return
+        payload = json.dumps(self.rolling_stats.snapshot(), ensure_ascii=False)
+        self.publisher.submit(f"{MQTT_TOPIC_PREFIX}/stats", payload, retain=True)
+    
+    def publish_recent_history(self, payload):
+        """Publish the retained backfill snapshot for dashboards"""
+        if not self.mqtt_client:
+            return
+        self.publisher.submit(f"{MQTT_TOPIC_PREFIX}/history", payload, retain=True)
+    
+    def publish_status(self, status_type, value, radio=None):
         """Publish system status to MQTT with proper JSON serialization"""
         try:
             if not self.mqtt_client:
                 return
             
-            # Use safe_json_convert to ensure everything is JSON serializable
-            safe_value = safe_json_convert(value)
-                
             status_data = {
                 'status_type': status_type,
-                'value': safe_value,
+                'value': value,  # Arbitrary values take the safe_json_convert fallback
                 'timestamp': datetime.now().isoformat(),
                 'message_count': self.message_count,
                 'uptime': time.time() - self.start_time if hasattr(self, 'start_time') else 0
             }
+            if radio:
+                status_data['radio'] = radio.name
             topic = f"{MQTT_TOPIC_PREFIX}/bridge_status"
-            payload = json.dumps(status_data, ensure_ascii=False)
-            self.mqtt_client.publish(topic, payload)
+            payload = STATUS_ENCODER.encode(status_data)
+            self.publisher.submit(topic, payload)
             
         except Exception as e:
             logger.error(f"Error publishing status to MQTT: {e}")
     
+    def bridge_stats(self):
+        """Internal counters for the periodic status update"""
+        with self.state_lock:
+            node_table = self.nodes.memory_report()
+        return {
+            "packets": self.message_count,
+            "duplicates": self.dedupe.total_duplicates,
+            "uptime": time.time() - self.start_time,
+            "radios": {radio.name: radio.stats() for radio in self.radios},
+            "subscriptions": self.subscriptions.stats(),
+            "publisher": self.publisher.stats(),
+            "ingest": self.ingest.stats(),
+            "node_table": node_table,
+            "history": self.history.stats() if self.history else None,
+            "capture": self.capture.stats() if self.capture else None,
+        }
+    
+    def housekeeping(self):
+        """Once-a-second duties shared by both runtimes"""
+        self.publish_duplicates()
+        self.expire_node_signals()
+        if time.monotonic() - self.last_latency_publish >= LATENCY_PUBLISH_INTERVAL:
+            self.last_latency_publish = time.monotonic()
+            self.publish_latency()
+        if time.monotonic() - self.last_stats_publish >= STATS_PUBLISH_INTERVAL:
+            self.last_stats_publish = time.monotonic()
+            self.publish_stats()
+        
+        # Publish periodic status
+        if self.message_count % 100 == 0 and self.message_count > 0:
+            self.publish_status("periodic_update", self.bridge_stats())
+    
+    async def ingest_task(self):
+        """Process queued packets on the event loop"""
+        while True:
+            item = self.ingest.get_nowait()
+            if item is None:
+                self.ingest_ready.clear()
+                await self.ingest_ready.wait()
+                continue
+            self.process_packet(*item)
+            await asyncio.sleep(0)  # Let MQTT I/O and other tasks run between packets
+    
+    async def heartbeat_task(self, radio):
+        """Event-loop version of heartbeat_monitor"""
+        logger.info(f"Starting connection monitor task for {radio.port}")
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                if not self.check_connection_health(radio):
+                    self.reconnect_meshtastic(radio)
+            except Exception as e:
+                logger.error(f"Error in heartbeat monitor: {e}")
+    
+    async def housekeeping_task(self):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                self.housekeeping()
+            except Exception as e:
+                logger.error(f"Error in housekeeping: {e}")
+    
+    async def run_async(self):
+        """asyncio runtime: MQTT I/O, heartbeats, ingest and publishing are loop tasks
+
+        Meshtastic callbacks arrive on the library's reader threads and are
+        handed to the loop with call_soon_threadsafe, so bridge state is
+        only touched from the loop (and, under state_lock, from the executor
+        threads that open serial ports).
+        """
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.ingest_ready = asyncio.Event()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, stop.set)
+        self.node_summary.start_timer = self.recent.start_timer = (
+            lambda delay, callback: LoopTimer(self.loop, delay, callback))
+        for radio in self.radios:
+            # Reconnect steps open serial ports and run modprobe, so they leave the loop
+            radio.recovery.start_timer = lambda delay, callback: LoopTimer(
+                self.loop, delay, lambda: self.loop.run_in_executor(None, callback))
+        
+        tasks = []
+        try:
+            self.start_time = time.time()
+            logger.info("Starting Meshtastic to MQTT bridge with auto-recovery (asyncio runtime)")
+            
+            if not self.setup_mqtt():
+                logger.error("Failed to setup MQTT, exiting")
+                return False
+            self.start_metrics()
+            
+            if self.history:
+                self.history.start()
+            if self.capture:
+                self.capture.start()
+            tasks.append(self.loop.create_task(self.ingest_task()))
+            tasks.append(self.loop.create_task(self.housekeeping_task()))
+            
+            for radio in self.radios:
+                # Opening the serial port blocks, so it runs in the default executor
+                if not await self.loop.run_in_executor(None, self.setup_meshtastic, radio):
+                    logger.error(f"Failed to setup Meshtastic connection on {radio.port}")
+                    self.reconnect_meshtastic(radio, "initial connect failed")
+                tasks.append(self.loop.create_task(self.heartbeat_task(radio)))
+            
+            if self.hotplug:
+                self.hotplug.start()
+            logger.info("Bridge started successfully. Monitoring connections...")
+            await stop.wait()
+            logger.info("Received shutdown signal, shutting down gracefully...")
+        except Exception as e:
+            logger.error(f"Error in main loop: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.running = False
+            self.cleanup()
+            if self.mqtt_io:
+                self.mqtt_io.close()
+    
     def run(self):
         """Main run loop with robust error handling"""
         try:
@@ -688,27 +3338,38 @@ class MeshtasticBridge:
             if not self.setup_mqtt():
                 logger.error("Failed to setup MQTT, exiting")
                 return False
+            self.start_metrics()
                 
             time.sleep(2)  # Give MQTT time to connect
             
-            if not self.setup_meshtastic():
-                logger.error("Failed to setup Meshtastic connection")
-                # Don't exit, keep trying in heartbeat
+            if self.history:
+                self.history.start()
+            if self.capture:
+                self.capture.start()
+            self.start_workers()
             
-            # Start heartbeat monitor
-            self.heartbeat_thread = threading.Thread(target=self.heartbeat_monitor, daemon=True)
-            self.heartbeat_thread.start()
+            for radio in self.radios:
+                if not self.setup_meshtastic(radio):
+                    logger.error(f"Failed to setup Meshtastic connection on {radio.port}")
+                    self.reconnect_meshtastic(radio, "initial connect failed")
+                
+                # Each radio gets its own monitor so one stuck device can't stall the others
+                radio.heartbeat_thread = threading.Thread(target=self.heartbeat_monitor, args=(radio,),
+                                                          name=f"heartbeat-{radio.name}", daemon=True)
+                radio.heartbeat_thread.start()
             
+            if self.hotplug:
+                self.hotplug.start()
             logger.info("Bridge started successfully. Monitoring connections...")
             
             # Keep the script running
             while self.running:
                 time.sleep(1)
-                
-                # Publish periodic status
-                if self.message_count % 100 == 0 and self.message_count > 0:
-                    self.publish_status("periodic_update", {"packets": self.message_count, "uptime": time.time() - self.start_time})
-                
+                try:
+                    self.housekeeping()
+                except Exception as e:
+                    logger.error(f"Error in housekeeping: {e}")
+
         except KeyboardInterrupt:
             logger.info("Shutting down due to keyboard interrupt...")
         except Exception as e:
@@ -722,19 +3383,37 @@ class MeshtasticBridge:
         try:
             logger.info("Cleaning up connections...")
             self.running = False
+            self.stop_workers()
+            self.node_summary.stop()
+            self.recent.stop()
+            if self.history:
+                self.history.stop()
+            if self.capture:
+                self.capture.stop()
             
-            if self.meshtastic_interface:
-                try:
-                    self.meshtastic_interface.close()
-                    logger.info("Meshtastic interface closed")
-                except Exception as e:
-                    logger.error(f"Error closing Meshtastic interface: {e}")
+            if self.hotplug:
+                self.hotplug.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            self.subscriptions.unsubscribe()
+            for radio in self.radios:
+                radio.recovery.stop()
+                self.subscriptions.retire(radio)
+                if radio.interface:
+                    try:
+                        radio.interface.close()
+                        logger.info(f"Meshtastic interface on {radio.port} closed")
+                    except Exception as e:
+                        logger.error(f"Error closing Meshtastic interface on {radio.port}: {e}")
                     
             if self.mqtt_client:
                 try:
                     self.publish_status("bridge_status", "disconnecting")
+                    self.publisher.stop()
                     self.mqtt_client.loop_stop()
                     self.mqtt_client.disconnect()
+                    if self.mqtt_io:
+                        self.mqtt_io.flush()  # No more loop iterations will run paho's write callbacks
                     logger.info("MQTT client disconnected")
                 except Exception as e:
                     logger.error(f"Error disconnecting MQTT client: {e}")
@@ -744,5 +3423,45 @@ class MeshtasticBridge:
             logger.error(f"Error during cleanup: {e}")
 
 if __name__ == "__main__":
-    bridge = MeshtasticBridge()
-    bridge.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Meshtastic to MQTT bridge")
+    parser.add_argument("--runtime", choices=["threads", "asyncio"], default=RUNTIME_MODE,
+                        help=f"concurrency model (default: {RUNTIME_MODE})")
+    parser.add_argument("--capture", metavar="FILE", default=CAPTURE_PATH,
+                        help="append every raw packet heard to FILE for --replay later")
+    simulation = parser.add_argument_group("simulation", "run without hardware (see mesh_simulator.py)")
+    simulation.add_argument("--simulate", type=int, nargs="?", const=40, metavar="NODES",
+                            help="replace the radios with a synthetic mesh of NODES nodes (default: 40)")
+    simulation.add_argument("--replay", metavar="FILE",
+                            help="replay a --capture file (or a JSONL capture) instead of synthetic traffic")
+    simulation.add_argument("--replay-from", type=float, default=0.0, metavar="SECONDS",
+                            help="start the replay this many seconds into the capture")
+    simulation.add_argument("--radios", type=int, default=1, help="simulated radios hearing the mesh (default: 1)")
+    simulation.add_argument("--rate", type=float, default=2.0, help="packets per second across the mesh (default: 2)")
+    simulation.add_argument("--duplicates", type=float, default=0.2,
+                            help="fraction of packets heard again as a rebroadcast (default: 0.2)")
+    simulation.add_argument("--burst", type=float, nargs=2, default=(0, 0), metavar=("INTERVAL", "SIZE"),
+                            help="every INTERVAL seconds emit SIZE extra packets back to back")
+    simulation.add_argument("--speed", type=float, default=1.0,
+                            help="replay speed: 1 = real time, 10 = ten times faster, 0 = as fast as possible")
+    simulation.add_argument("--max-gap", type=float, default=60.0, metavar="SECONDS",
+                            help="cut pauses in the replayed capture down to SECONDS; 0 keeps them (default: 60)")
+    simulation.add_argument("--seed", type=int, default=1, help="random seed for the synthetic mesh (default: 1)")
+    args = parser.parse_args()
+    
+    if args.simulate is not None or args.replay:
+        from mesh_simulator import SimulatedInterfaceLayer, SimulationConfig
+        config = SimulationConfig(nodes=args.simulate or 40, rate=args.rate, duplicate_ratio=args.duplicates,
+                                  burst_interval=args.burst[0], burst_size=int(args.burst[1]), seed=args.seed,
+                                  replay=args.replay, speed=args.speed, replay_from=args.replay_from,
+                                  max_gap=args.max_gap)
+        source = None
+        if args.replay and PacketCaptureReader.is_capture(args.replay):
+            source = lambda: PacketCaptureReader(args.replay).replay(args.replay_from)
+        bridge = MeshtasticBridge(SimulatedInterfaceLayer(config, source),
+                                  [f"sim{index}" for index in range(args.radios)], args.capture)
+    else:
+        bridge = MeshtasticBridge(capture_path=args.capture)
+    if args.runtime == "asyncio":
+        asyncio.run(bridge.run_async())
+    else:
+        bridge.run()
\ No newline at end of file